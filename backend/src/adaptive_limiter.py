@@ -0,0 +1,69 @@
+import asyncio
+from collections import deque
+from statistics import median
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adjusts itself to observed page latency and errors
+
+    Works like an asyncio.Semaphore, but every `window` finished pages the limit
+    is re-evaluated: it is halved when pages got slow or started failing, and
+    raised by one tab when things look healthy (additive increase,
+    multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        initial=8,
+        minimum=1,
+        maximum=16,
+        target_latency=30.0,
+        max_error_rate=0.2,
+        window=8,
+    ):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.active = 0
+        self.latencies = deque(maxlen=window)
+        self.errors = deque(maxlen=window)
+        self.window = window
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self):
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    async def record(self, latency, ok):
+        """Feed back how long one page took and whether it worked"""
+        async with self.condition:
+            self.latencies.append(latency)
+            self.errors.append(0 if ok else 1)
+            if len(self.latencies) >= self.window:
+                self._adjust()
+            self.condition.notify_all()
+
+    def _adjust(self):
+        error_rate = sum(self.errors) / len(self.errors)
+        typical_latency = median(self.latencies)
+        if error_rate > self.max_error_rate or typical_latency > self.target_latency:
+            new_limit = max(self.minimum, self.limit // 2)
+        else:
+            new_limit = min(self.maximum, self.limit + 1)
+
+        if new_limit != self.limit:
+            print(
+                f"Concurrency {self.limit} -> {new_limit} "
+                f"(median latency {typical_latency:.1f}s, error rate {error_rate:.0%})"
+            )
+            self.limit = new_limit
+        self.latencies.clear()
+        self.errors.clear()
@@ -1,9 +1,16 @@
-import json
-from glob import glob
+from datetime import datetime
 
+from roster import DEFAULT_STARTING_VALUE, join
+from trading_calendar import NY
 
-def add_user(username, portfolio_url):
-    """Add a new user to the system."""
+
+def add_user(username, portfolio_url, starting_value=DEFAULT_STARTING_VALUE):
+    """Add a new user to the system.
+
+    Only appends to the player lists and the roster, the snapshots taken
+    before they joined get their starting value when read (see roster.py).
+    The next scrape picks them up.
+    """
 
     # Add portfolio URL to portfolios.txt
     with open("./backend/portfolios/portfolios.txt", "a") as f:
@@ -13,38 +20,9 @@ def add_user(username, portfolio_url):
     with open("./backend/portfolios/usernames.txt", "a") as f:
         f.write(f"{username}\n")
 
-    # Update latest leaderboard with initial data
-    leaderboard_path = "./backend/leaderboards/leaderboard-latest.json"
-    with open(leaderboard_path, "r") as f:
-        leaderboard = json.load(f)
-
-    # Add new user with initial values
-    leaderboard[username] = [
-        100000.00,  # Initial account value
-        portfolio_url,  # Portfolio URL
-        [],  # Empty stock holdings
-    ]
-
-    # Write updated leaderboard
-    with open(leaderboard_path, "w") as f:
-        json.dump(leaderboard, f)
-
-    # Update all leaderboard files in 'in_time' folder
-    leaderboard_files = glob("./backend/leaderboards/in_time/*.json")
-    for lb_file in leaderboard_files:
-        with open(lb_file, "r") as f:
-            lb_data = json.load(f)
-
-        # If user does not exist, add them with initial values
-        if username not in lb_data:
-            lb_data[username] = [
-                100000.00,  # Initial account value
-                portfolio_url,  # Portfolio URL
-                [],  # Empty stock holdings
-            ]
-            # Write updated leaderboard
-            with open(lb_file, "w") as f:
-                json.dump(lb_data, f)
+    # Snapshot times are naive New York wall clock
+    joined = datetime.now(NY).replace(tzinfo=None)
+    join(username, portfolio_url, joined, starting_value)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+"""S&P 500 (SPY) 5 minute bars the charts are benchmarked against
+
+The closes are kept in backend/sp500_bars.csv between runs, so a render
+only downloads the days from the last cached one on (at most once per
+REUSE_FOR), and carries on with the cached bars if Yahoo is slow or down.
+Yahoo only serves 5 minute bars for the last 60 days, the file is also
+what keeps the start of the season charted. The earliest day ever asked
+for is kept in backend/sp500_bars_since.txt, so days before the cached
+ones are only backfilled once, not by every new process.
+
+sp500_values is the one place snapshots are lined up with the bars, so
+the index and every player page show the same benchmark.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+from roster import DEFAULT_STARTING_VALUE
+from trading_calendar import NY
+
+SP500_TICKER = "SPY"
+SP500_BARS_PATH = "./backend/sp500_bars.csv"
+SP500_SINCE_PATH = "./backend/sp500_bars_since.txt"
+# How far back Yahoo serves 5 minute bars, asking for more fails outright
+INTRADAY_HISTORY = timedelta(days=59)
+# Renders within this long of a download reuse it, one render cycle's pages
+# all see the same bars
+REUSE_FOR = timedelta(minutes=1)
+
+# (first day asked for, when it was last topped up, closes)
+_cache = None
+
+
+def _empty():
+    return pd.Series(
+        dtype=float, name="Close", index=pd.DatetimeIndex([], tz="UTC", name="Datetime")
+    )
+
+
+def load_bars(path=SP500_BARS_PATH):
+    """The cached closes, indexed by the bars' start time in UTC"""
+    if not os.path.exists(path):
+        return _empty()
+    closes = pd.read_csv(path, index_col=0)["Close"]
+    closes.index = pd.to_datetime(closes.index, utc=True)
+    return closes
+
+
+def save_bars(closes, path=SP500_BARS_PATH):
+    temporary = path + ".tmp"
+    closes.to_csv(temporary, index_label="Datetime")
+    os.replace(temporary, path)
+
+
+def load_since(path=SP500_SINCE_PATH):
+    """The earliest day bars were downloaded from, None if never"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as file:
+        return date.fromisoformat(file.read().strip())
+
+
+def save_since(day, path=SP500_SINCE_PATH):
+    with open(path, "w") as file:
+        file.write(day.isoformat())
+
+
+def download_bars(start_date, end_date):
+    """The closes of the days from start_date up to end_date, None if Yahoo failed"""
+    try:
+        bars = yf.download(SP500_TICKER, start=start_date, end=end_date, interval="5m")
+    except Exception as e:
+        print(f"Couldn't download {SP500_TICKER} bars: {e}")
+        with open("logs/log.txt", "a") as file:
+            file.write(
+                f"Couldn't download {SP500_TICKER} bars, using the cached ones: {e}, {datetime.now()}\n"
+            )
+        return None
+    if bars is None or len(bars) == 0:
+        return _empty()
+    closes = bars["Close"]
+    # Newer yfinance versions have a (price, ticker) column per value
+    if isinstance(closes, pd.DataFrame):
+        closes = closes[SP500_TICKER]
+    closes = closes.dropna().rename("Close")
+    closes.index = closes.index.tz_convert("UTC").rename("Datetime")
+    return closes
+
+
+def sp500_bars(start_date, end_date):
+    """The SPY 5 minute closes of the days from start_date up to end_date
+
+    end_date not included. Days before the cached ones are downloaded the
+    first time they're asked for (as far back as Yahoo goes), after that
+    only the days from the last cached one on, which is the one still
+    getting new bars.
+    """
+    global _cache
+    now = datetime.now()
+    if _cache is None:
+        _cache = (load_since(), None, load_bars())
+    first_day, fetched_at, closes = _cache
+    days = closes.index.tz_convert(NY).date
+    asked_before = first_day is not None and start_date >= first_day
+    if not asked_before or fetched_at is None or now - fetched_at >= REUSE_FOR:
+        if len(closes) == 0 or (not asked_before and start_date < days[0]):
+            oldest = datetime.now(NY).date() - INTRADAY_HISTORY
+            fresh = download_bars(max(start_date, oldest), end_date)
+        else:
+            fresh = download_bars(days[-1], end_date)
+        if fresh is not None and len(fresh):
+            # Downloaded bars replace the cached ones, cached ones Yahoo
+            # doesn't serve any more are kept
+            closes = pd.concat([closes, fresh])
+            closes = closes[~closes.index.duplicated(keep="last")].sort_index()
+            save_bars(closes)
+            days = closes.index.tz_convert(NY).date
+        if fresh is not None and not asked_before:
+            first_day = start_date
+            save_since(first_day)
+        # A failed download is tried again next time, not on every render
+        _cache = (first_day, now, closes)
+    return closes[(days >= start_date) & (days < end_date)]
+
+
+def sp500_values(times, start_value=DEFAULT_STARTING_VALUE):
+    """What start_value put in SPY at the first of `times` was worth at each
+
+    `times` are sorted naive New York wall clock, like the snapshot times,
+    and each is matched to the nearest bar. None everywhere if there are no
+    bars to go by.
+    """
+    if len(times) == 0:
+        return []
+    times = pd.DatetimeIndex(times).tz_localize(NY)
+    closes = sp500_bars(times[0].date(), times[-1].date() + timedelta(days=1))
+    if len(closes) == 0:
+        return [None] * len(times)
+    # The price the benchmark starts at is the first bar from the first time on
+    first = min(closes.index.searchsorted(times[0]), len(closes) - 1)
+    nearest = closes.index.get_indexer(times, method="nearest")
+    return (start_value * closes.to_numpy()[nearest] / closes.iloc[first]).tolist()
@@ -0,0 +1,156 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytz
+from playwright.async_api import async_playwright
+
+from main import (
+    LIGHTWEIGHT_SCRAPE,
+    get_account_information,
+    open_scraper,
+    render_pages,
+    save_leaderboard,
+    scrape_with_context,
+    should_update,
+)
+from snapshot_archive import archive_closed_days
+from trading_calendar import is_trading_day
+
+# Scrapes land on wall clock marks (:00, :05, :10, ...) so they line up with
+# the 5 minute grid generate_trading_timestamps builds the charts on
+INTERVAL_MINUTES = int(os.environ.get("DAEMON_INTERVAL_MINUTES", "5"))
+PUBLISH = os.environ.get("DAEMON_PUBLISH", "True") == "True"
+
+tz_NY = pytz.timezone("America/New_York")
+
+
+def next_run_time(now, interval_minutes=INTERVAL_MINUTES):
+    """The next wall clock mark that is a multiple of interval_minutes"""
+    mark = now.replace(second=0, microsecond=0)
+    minutes_past = mark.minute % interval_minutes
+    return mark + timedelta(minutes=interval_minutes - minutes_past)
+
+
+class WarmScraper:
+    """Keeps one browser and one logged in context alive between scrape cycles"""
+
+    def __init__(self, lightweight=LIGHTWEIGHT_SCRAPE):
+        self.lightweight = lightweight
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.session = None
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        self.browser, self.context, self.session = await open_scraper(
+            self.playwright, self.lightweight
+        )
+        try:
+            await self.session.ensure()
+        except Exception as e:
+            # scrape_with_context logs in before every scrape anyway
+            print(f"Login failed, trying again at the next scrape: {e}")
+
+    async def close(self):
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+        self.playwright = self.browser = self.context = self.session = None
+
+    async def restart(self):
+        print("Restarting browser...")
+        try:
+            await self.close()
+        except Exception as e:
+            print(f"Error closing browser: {e}")
+        await self.start()
+
+    async def scrape(self, urls, metrics=None):
+        if self.browser is None or not self.browser.is_connected():
+            await self.restart()
+        return await scrape_with_context(
+            self.context, self.session, urls, self.lightweight, metrics
+        )
+
+
+async def publish():
+    """Commit and push the regenerated pages, same as `pixi run git_push`"""
+    for command in (
+        ["git", "add", "-A", "."],
+        ["git", "commit", "-m", "leaderboard update"],
+        ["git", "push", "origin"],
+    ):
+        process = await asyncio.create_subprocess_exec(*command)
+        if await process.wait() != 0:
+            print(f"{' '.join(command)} failed, skipping the rest of this publish")
+            return
+
+
+async def render_and_publish():
+    try:
+        # Rendering is CPU bound, keep it off the event loop the browser lives on
+        await asyncio.to_thread(render_pages)
+        await asyncio.to_thread(archive_closed_days)
+        if PUBLISH:
+            await publish()
+    except Exception as e:
+        print(f"Render/publish failed: {e}")
+        with open("logs/log.txt", "a") as file:
+            file.write(f"Daemon render/publish failed: {e}, {datetime.now()}\n")
+
+
+async def run_daemon():
+    scraper = WarmScraper()
+    await scraper.start()
+    publishing = None
+    try:
+        while True:
+            run_at = next_run_time(datetime.now(tz_NY))
+            await asyncio.sleep((run_at - datetime.now(tz_NY)).total_seconds())
+            curr_time = datetime.now(tz_NY)
+            if not is_trading_day(curr_time):
+                continue
+
+            if should_update(curr_time):
+                try:
+                    account_values = await get_account_information(
+                        scrape=scraper.scrape
+                    )
+                    # Only the scrape overlaps with the previous render/publish,
+                    # it reads and commits the files saving writes
+                    if publishing is not None:
+                        await publishing
+                        publishing = None
+                    save_leaderboard(account_values, curr_time)
+                except Exception as e:
+                    print(f"Scrape at {curr_time} failed: {e}")
+                    with open("logs/log.txt", "a") as file:
+                        file.write(f"Daemon scrape failed: {e}, {datetime.now()}\n")
+                    try:
+                        await scraper.restart()
+                    except Exception as e:
+                        # scrape() restarts a browser that isn't running
+                        print(f"Restart failed, trying again next cycle: {e}")
+                        with open("logs/log.txt", "a") as file:
+                            file.write(
+                                f"Daemon browser restart failed: {e}, {datetime.now()}\n"
+                            )
+                    continue
+            else:
+                print("Update disabled")
+
+            # Let the previous render/publish finish before starting the next one
+            if publishing is not None:
+                await publishing
+            publishing = asyncio.create_task(render_and_publish())
+    finally:
+        if publishing is not None:
+            await publishing
+        await scraper.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_daemon())
@@ -0,0 +1,228 @@
+"""SQLite index over the history store for per-player and per-ticker queries
+
+A player's value or rank over time and "who holds this ticker" are indexed
+lookups here instead of a scan over every snapshot. The database is built
+from the history store (see history_store.py) and kept in sync with it by
+main.py after each scrape, so it's a local cache and isn't committed: delete
+it and the next sync rebuilds it.
+"""
+
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+from history_store import TIME_FORMAT, rank_values, shared_history
+
+HISTORY_DB_PATH = "./backend/history.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    time TEXT NOT NULL UNIQUE,
+    in_time INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS account_values (
+    player INTEGER NOT NULL REFERENCES players (id),
+    snapshot INTEGER NOT NULL REFERENCES snapshots (id),
+    value REAL NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (player, snapshot)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS holdings (
+    player INTEGER NOT NULL REFERENCES players (id),
+    snapshot INTEGER NOT NULL REFERENCES snapshots (id),
+    ticker TEXT NOT NULL,
+    amount REAL,
+    gain REAL
+);
+CREATE INDEX IF NOT EXISTS holdings_player_time ON holdings (player, snapshot);
+CREATE INDEX IF NOT EXISTS holdings_ticker_time ON holdings (ticker, snapshot);
+"""
+# Snapshot ids are the store's row numbers, which go up with time, so the
+# (player, snapshot) and (ticker, snapshot) keys are (player, time) and
+# (ticker, time) indexes
+
+
+class HistoryDB:
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def sync(self, history=None):
+        """Add the snapshots the store has that the database doesn't yet"""
+        if history is None:
+            history = shared_history()
+        with self.connection:
+            # Take the write lock before looking, so main.py and the bot
+            # syncing at the same time can't both add the same snapshots
+            self.connection.execute("BEGIN IMMEDIATE")
+            count, last_time = self.connection.execute(
+                "SELECT COUNT(*), MAX(time) FROM snapshots"
+            ).fetchone()
+            if count > len(history) or (
+                count and history.times[count - 1].strftime(TIME_FORMAT) != last_time
+            ):
+                # The store was rebuilt underneath us, start over
+                print(f"{self.path} is out of step with the history store, rebuilding")
+                for table in ("holdings", "account_values", "snapshots", "players"):
+                    self.connection.execute(f"DELETE FROM {table}")
+                count = 0
+            if count == len(history):
+                return
+
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO players (id, name, url) VALUES (?, ?, ?)",
+                (
+                    (player, name, url)
+                    for player, (name, url) in enumerate(
+                        zip(history.names, history.urls)
+                    )
+                ),
+            )
+            # Only the new snapshots need ranking
+            rank_matrix = rank_values(history.values[count:])
+            for row, state in history.iter_holdings(count):
+                values = history.values[row]
+                ranks = {
+                    int(player): int(rank_matrix[row - count, player])
+                    for player in np.flatnonzero(~np.isnan(values))
+                }
+                self.connection.execute(
+                    "INSERT INTO snapshots (id, time, in_time) VALUES (?, ?, ?)",
+                    (
+                        row,
+                        history.times[row].strftime(TIME_FORMAT),
+                        int(history.in_time[row]),
+                    ),
+                )
+                self.connection.executemany(
+                    "INSERT INTO account_values VALUES (?, ?, ?, ?)",
+                    (
+                        (player, row, float(values[player]), rank)
+                        for player, rank in ranks.items()
+                    ),
+                )
+                self.connection.executemany(
+                    "INSERT INTO holdings VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (player, row, symbol, amount, gain)
+                        for player, positions in state.items()
+                        if player in ranks
+                        for symbol, (amount, gain) in positions.items()
+                    ),
+                )
+        print(f"Synced {len(history) - count} snapshots into {self.path}")
+
+    def _player_id(self, name):
+        row = self.connection.execute(
+            "SELECT id FROM players WHERE name = ?", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def snapshot_times(self, in_time_only=True):
+        """Every snapshot time, oldest first"""
+        rows = self.connection.execute(
+            "SELECT time FROM snapshots WHERE in_time >= ? ORDER BY id",
+            (int(in_time_only),),
+        )
+        return [datetime.strptime(time, TIME_FORMAT) for (time,) in rows]
+
+    def player_history(self, name, in_time_only=True, roster=None):
+        """[(time, value, rank), ...] for the snapshots the player was in
+
+        With a `roster` (see roster.py), the snapshots from before a
+        mid-season player joined come first at their starting value, with
+        no rank.
+        """
+        baseline = []
+        entry = (roster or {}).get(name)
+        if entry is not None:
+            rows = self.connection.execute(
+                """
+                SELECT time FROM snapshots
+                WHERE in_time >= ? AND time < ? AND id NOT IN (
+                    SELECT snapshot FROM account_values WHERE player = ?
+                )
+                ORDER BY id
+                """,
+                (
+                    int(in_time_only),
+                    entry.joined.strftime(TIME_FORMAT),
+                    self._player_id(name),
+                ),
+            )
+            baseline = [
+                (datetime.strptime(time, TIME_FORMAT), entry.starting_value, None)
+                for (time,) in rows
+            ]
+        rows = self.connection.execute(
+            """
+            SELECT snapshots.time, account_values.value, account_values.rank
+            FROM account_values JOIN snapshots ON snapshots.id = account_values.snapshot
+            WHERE account_values.player = ? AND snapshots.in_time >= ?
+            ORDER BY account_values.snapshot
+            """,
+            (self._player_id(name), int(in_time_only)),
+        )
+        history = [
+            (datetime.strptime(time, TIME_FORMAT), value, rank)
+            for time, value, rank in rows
+        ]
+        return sorted(baseline + history) if baseline else history
+
+    def player_url(self, name):
+        row = self.connection.execute(
+            "SELECT url FROM players WHERE name = ?", (name,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def player_holdings(self, name, when=None, in_time_only=True):
+        """[[ticker, amount, gain], ...] in the player's last snapshot at or before `when`"""
+        player = self._player_id(name)
+        snapshot = self._last_snapshot(when, in_time_only, player)
+        rows = self.connection.execute(
+            """
+            SELECT ticker, amount, gain FROM holdings
+            WHERE player = ? AND snapshot = ? ORDER BY ticker
+            """,
+            (player, snapshot),
+        )
+        return [list(row) for row in rows]
+
+    def ticker_holders(self, ticker, when=None, in_time_only=False):
+        """[(name, amount, gain), ...] of who held `ticker` as of `when`, biggest first"""
+        snapshot = self._last_snapshot(when, in_time_only)
+        rows = self.connection.execute(
+            """
+            SELECT players.name, holdings.amount, holdings.gain
+            FROM holdings JOIN players ON players.id = holdings.player
+            WHERE holdings.ticker = ? AND holdings.snapshot = ?
+            ORDER BY holdings.amount DESC
+            """,
+            (ticker.upper(), snapshot),
+        )
+        return rows.fetchall()
+
+    def _last_snapshot(self, when, in_time_only, player=None):
+        """Id of the last snapshot at or before `when` (now if None)"""
+        query = "SELECT MAX(snapshots.id) FROM snapshots"
+        conditions = ["snapshots.in_time >= ?"]
+        parameters = [int(in_time_only)]
+        if player is not None:
+            query += " JOIN account_values ON account_values.snapshot = snapshots.id"
+            conditions.append("account_values.player = ?")
+            parameters.append(player)
+        if when is not None:
+            conditions.append("snapshots.time <= ?")
+            parameters.append(when.strftime(TIME_FORMAT))
+        query += " WHERE " + " AND ".join(conditions)
+        return self.connection.execute(query, parameters).fetchone()[0]
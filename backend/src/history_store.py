@@ -0,0 +1,500 @@
+"""Append-only columnar store for the leaderboard history
+
+The per-snapshot JSON files repeat every player's name, URL and holdings and
+have to be parsed one by one on every render. The store keeps the same data
+as three append-only files under backend/history:
+
+    players.csv   the player axis, one `name,url` row per player in id order
+    values.csv    the time axis and value matrix, one row per snapshot:
+                  time,in_time,keyframe,holdings_start,holdings_end,value_0,...
+                  (value_i is player i's account value, empty if not scraped)
+    holdings.csv  `op,player,symbol,amount,gain` rows; a snapshot's rows are
+                  the byte range [holdings_start, holdings_end) of the file
+
+Holdings are delta encoded. A keyframe snapshot lists every position of every
+player; the ones in between only list what changed since the snapshot before:
+
+    +  position opened       ~  position resized (bought or sold shares)
+    -  position closed       =  value or gain moved (or unchanged, in keyframes)
+
+so the holdings at any snapshot are its keyframe plus the deltas up to it, one
+contiguous read. Each scrape appends one row to values.csv (plus its holdings),
+so a load is one read_csv no matter how long the season has been going. Run
+`python ./backend/src/history_store.py migrate` to build it from the JSON
+snapshots; load() does the same automatically the first time.
+"""
+
+import csv
+import io
+import os
+import sys
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from holding import cost_basis, parse_holdings, resized
+from snapshot_archive import list_snapshots, load_snapshots, snapshot_time
+
+HISTORY_DIR = "./backend/history"
+LEADERBOARDS_DIR = "./backend/leaderboards"
+TIME_FORMAT = "%Y-%m-%d-%H_%M"  # same as the snapshot file names
+
+PLAYERS_FILE = "players.csv"
+VALUES_FILE = "values.csv"
+HOLDINGS_FILE = "holdings.csv"
+# time, in_time, keyframe, holdings_start, holdings_end come before the values
+VALUE_OFFSET = 5
+
+# Snapshots between keyframes, about a trading day of 5 minute scrapes. Longer
+# means less disk but more deltas to replay to rebuild a snapshot's holdings.
+KEYFRAME_INTERVAL = int(os.environ.get("HISTORY_KEYFRAME_INTERVAL", "78"))
+
+TRADE_OPS = ("+", "-", "~")
+
+
+def _number(text):
+    return float(text) if text else None
+
+
+def position_op(previous, current):
+    """The op for a position going from `previous` to `current` (amount, gain)"""
+    if previous is None:
+        return "+"
+    if None not in previous and None not in current:
+        if resized(cost_basis(*previous), cost_basis(*current)):
+            return "~"
+    return "="
+
+
+def apply_deltas(rows, state=None):
+    """Replay holdings rows onto state, {player id: {symbol: (amount, gain)}}"""
+    state = {} if state is None else state
+    for op, player, symbol, amount, gain in rows:
+        positions = state.setdefault(int(player), {})
+        if op == "-":
+            positions.pop(symbol, None)
+        else:
+            positions[symbol] = (_number(amount), _number(gain))
+    return state
+
+
+def rank_values(values):
+    """Leaderboard ranks of a snapshots x players value matrix
+
+    1 is the highest value in a snapshot (row), ties go to the lower player
+    id, NaN where the player wasn't in the snapshot.
+    """
+    # NaNs sort last, so they don't push anyone down
+    order = np.argsort(-values, axis=1, kind="stable")
+    ranks = np.empty(values.shape)
+    np.put_along_axis(
+        ranks,
+        order,
+        np.broadcast_to(np.arange(1, values.shape[1] + 1), order.shape),
+        axis=1,
+    )
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+
+class History:
+    """A loaded history: times x players value matrix plus lazy holdings
+
+    `times` are naive New York wall clock datetimes, `values[i, j]` is player
+    j's account value at times[i] (NaN if they weren't scraped then).
+    """
+
+    def __init__(self, store, times, in_time, names, urls, values, holdings_ranges):
+        self.store = store
+        self.times = times
+        self.in_time = in_time
+        self.names = names
+        self.urls = urls
+        self.values = values
+        # Per snapshot: where its keyframe starts, where its own rows start
+        # and where they end, as byte offsets into holdings.csv
+        self.holdings_ranges = holdings_ranges
+        self.index = {name: i for i, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.times)
+
+    def select(self, mask):
+        """The snapshots where mask is True"""
+        mask = np.asarray(mask, dtype=bool)
+        return History(
+            self.store,
+            [time for time, keep in zip(self.times, mask) if keep],
+            self.in_time[mask],
+            self.names,
+            self.urls,
+            self.values[mask],
+            self.holdings_ranges[mask],
+        )
+
+    def with_baseline(self, roster):
+        """Fill in the starting value of players from before they joined
+
+        `roster` is load_roster()'s {name: RosterEntry}. Only the value
+        matrix is filled in, holdings still only cover scraped snapshots.
+        """
+        values = self.values.copy()
+        for entry in roster.values():
+            player = self.index.get(entry.name)
+            if player is None:
+                continue  # not scraped yet, nothing to chart
+            before = bisect_left(self.times, entry.joined)
+            column = values[:before, player]
+            column[np.isnan(column)] = entry.starting_value
+        return History(
+            self.store,
+            self.times,
+            self.in_time,
+            self.names,
+            self.urls,
+            values,
+            self.holdings_ranges,
+        )
+
+    def in_session(self):
+        """Only the in_time snapshots, which is what the charts are built from"""
+        return self.select(self.in_time)
+
+    def frame(self):
+        """The value matrix as a DataFrame indexed by time, one column per player"""
+        return pd.DataFrame(self.values, index=self.times, columns=self.names)
+
+    def ranks(self):
+        """Leaderboard rank matrix, same shape as values, see rank_values"""
+        return rank_values(self.values)
+
+    def row_at(self, when):
+        """The last snapshot taken at or before `when`, None if there isn't one"""
+        row = bisect_right(self.times, when) - 1
+        return row if row >= 0 else None
+
+    def holdings_at(self, row):
+        """{name: [[symbol, amount, gain], ...]} for snapshot `row`
+
+        Only players scraped in that snapshot are included, positions come
+        back sorted by symbol (the order the simulator lists them in).
+        """
+        keyframe_start, _start, end = self.holdings_ranges[row]
+        state = apply_deltas(self.store.read_holdings(keyframe_start, end))
+        return {
+            self.names[player]: [
+                [symbol, *positions[symbol]] for symbol in sorted(positions)
+            ]
+            for player, positions in state.items()
+            if not np.isnan(self.values[row, player])
+        }
+
+    def iter_holdings(self, first_row=0):
+        """Yield (row, {player id: {symbol: (amount, gain)}}) from first_row on
+
+        Replays the deltas once in order, much cheaper than holdings_at for
+        every row. Needs the full history, not a select()ed one. The state
+        includes players missing from a row and changes as the replay goes
+        on, copy it to keep it past the next row.
+        """
+        if first_row >= len(self):
+            return
+        keyframe_start = self.holdings_ranges[first_row, 0]
+        starts = self.holdings_ranges[:, 1]
+        data = self.store.read_holdings_bytes(
+            keyframe_start, self.holdings_ranges[-1, 2]
+        )
+        state = {}
+        for row in range(int(np.searchsorted(starts, keyframe_start)), len(self)):
+            row_keyframe, start, end = self.holdings_ranges[row] - keyframe_start
+            if start == row_keyframe:
+                state = {}
+            text = data[start:end].decode()
+            apply_deltas(csv.reader(io.StringIO(text)), state)
+            if row >= first_row:
+                yield row, state
+
+    def holdings_on(self, when):
+        """The holdings as of `when`, see holdings_at"""
+        row = self.row_at(when)
+        return {} if row is None else self.holdings_at(row)
+
+    def changes(self, row):
+        """{name: [(op, symbol), ...]} of the trades made since the snapshot before
+
+        Ops are "+" opened, "-" closed and "~" resized. The first snapshot has
+        no snapshot before it, so everything in it shows up as opened.
+        """
+        _keyframe_start, start, end = self.holdings_ranges[row]
+        changes = {}
+        for op, player, symbol, _amount, _gain in self.store.read_holdings(start, end):
+            if op in TRADE_OPS:
+                changes.setdefault(self.names[int(player)], []).append((op, symbol))
+        return changes
+
+    def trades_since(self, row):
+        """{name: {symbol: op}} netted over the snapshots after `row`
+
+        A position bought and sold again in between drops out, one sold and
+        bought back counts as resized. Players who weren't in snapshot `row`
+        are left out, their first snapshot would show everything as opened.
+        """
+        trades = {}
+        for later in range(row + 1, len(self)):
+            for name, ops in self.changes(later).items():
+                if np.isnan(self.values[row, self.index[name]]):
+                    continue
+                symbols = trades.setdefault(name, {})
+                for op, symbol in ops:
+                    earlier = symbols.get(symbol)
+                    if op == "-" and earlier == "+":
+                        del symbols[symbol]
+                    elif op == "+" and earlier == "-":
+                        symbols[symbol] = "~"
+                    elif earlier != "+":
+                        symbols[symbol] = op
+        return {name: symbols for name, symbols in trades.items() if symbols}
+
+
+class HistoryStore:
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        self._players = None
+        # Holdings after the last snapshot, and how many snapshots ago the
+        # last keyframe was, so append() can write deltas
+        self._state = None
+        self._since_keyframe = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self.path(VALUES_FILE))
+
+    def players(self):
+        """[(name, url), ...] in player id order"""
+        if self._players is None:
+            self._players = []
+            if os.path.exists(self.path(PLAYERS_FILE)):
+                with open(self.path(PLAYERS_FILE), "r", newline="") as file:
+                    self._players = [tuple(row) for row in csv.reader(file)]
+        return self._players
+
+    def _load_state(self):
+        """Rebuild the holdings after the last snapshot from its keyframe"""
+        self._state = {}
+        self._since_keyframe = None
+        if not self.exists():
+            return
+        keyframe_start = end = None
+        with open(self.path(VALUES_FILE), "r") as file:
+            for count, line in enumerate(reversed(file.readlines())):
+                _time, _in_time, keyframe, start, row_end = line.split(",", 5)[:5]
+                end = int(row_end) if end is None else end
+                if keyframe == "1":
+                    keyframe_start = int(start)
+                    self._since_keyframe = count
+                    break
+        if keyframe_start is not None:
+            self._state = apply_deltas(self.read_holdings(keyframe_start, end))
+
+    def append(self, account_values, when, in_time):
+        """Add one scrape (name -> [value, url, holdings]) taken at `when`"""
+        os.makedirs(self.directory, exist_ok=True)
+        if self._state is None:
+            self._load_state()
+        players = self.players()
+        ids = {name: i for i, (name, _url) in enumerate(players)}
+        new_players = []
+        for name, data in account_values.items():
+            if name not in ids:
+                ids[name] = len(players) + len(new_players)
+                new_players.append((name, data[1].strip()))
+
+        keyframe = (
+            self._since_keyframe is None
+            or self._since_keyframe + 1 >= KEYFRAME_INTERVAL
+        )
+        rows = []
+        for name, data in account_values.items():
+            # Snapshots from before holdings were scraped leave them as they were
+            if len(data) < 3:
+                continue
+            player = ids[name]
+            previous = self._state.get(player, {})
+            current = {
+                holding.symbol: (holding.amount, holding.gain)
+                for holding in parse_holdings(data[2])
+            }
+            for symbol, position in current.items():
+                op = position_op(previous.get(symbol), position)
+                if keyframe or op != "=" or previous[symbol] != position:
+                    rows.append([op, player, symbol, *position])
+            for symbol in previous:
+                if symbol not in current:
+                    rows.append(["-", player, symbol, None, None])
+            self._state[player] = current
+        if keyframe:
+            # A keyframe also carries the players missing from this scrape,
+            # so nothing before it is needed to rebuild any later snapshot
+            scraped = {ids[name] for name, data in account_values.items()}
+            for player, positions in self._state.items():
+                if player not in scraped:
+                    for symbol, position in positions.items():
+                        rows.append(["=", player, symbol, *position])
+
+        # Holdings first and the values row last, so a run that dies half way
+        # through never leaves a values row pointing at missing holdings
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(rows)
+        holdings = buffer.getvalue().encode()
+        with open(self.path(HOLDINGS_FILE), "ab") as file:
+            start = file.tell()
+            file.write(holdings)
+
+        if new_players:
+            with open(self.path(PLAYERS_FILE), "a", newline="") as file:
+                csv.writer(file, lineterminator="\n").writerows(new_players)
+            players.extend(new_players)
+
+        values = [""] * len(players)
+        for name, data in account_values.items():
+            values[ids[name]] = repr(float(data[0]))
+        row = [
+            when.strftime(TIME_FORMAT),
+            int(in_time),
+            int(keyframe),
+            start,
+            start + len(holdings),
+        ]
+        with open(self.path(VALUES_FILE), "a", newline="") as file:
+            csv.writer(file, lineterminator="\n").writerow(row + values)
+        self._since_keyframe = 0 if keyframe else self._since_keyframe + 1
+
+    def read_holdings_bytes(self, start, end):
+        with open(self.path(HOLDINGS_FILE), "rb") as file:
+            file.seek(start)
+            return file.read(end - start)
+
+    def read_holdings(self, start, end):
+        text = self.read_holdings_bytes(start, end).decode()
+        return csv.reader(io.StringIO(text))
+
+    def _read_values(self, offset=0):
+        """Parse values.csv from byte `offset` on
+
+        Returns (players, frame, offset read up to), frame is None if there
+        were no new rows.
+        """
+        with open(self.path(VALUES_FILE), "rb") as file:
+            file.seek(offset)
+            data = file.read()
+        # Only whole rows, append() may be halfway through writing the next one
+        data = data[: data.rfind(b"\n") + 1]
+        # Read after the values, so every player in them is already listed
+        players = self.players()
+        if not data:
+            return players, None, offset
+        frame = pd.read_csv(
+            io.BytesIO(data),
+            header=None,
+            names=range(VALUE_OFFSET + len(players)),
+            dtype={0: str},
+        )
+        return players, frame, offset + len(data)
+
+    def _history(self, players, frame, previous=None):
+        """A History of the rows in `frame`, after the ones in `previous`"""
+        starts = frame[3].to_numpy(dtype=np.int64)
+        # Carry each keyframe's start forward to the snapshots after it
+        keyframe_starts = np.where(frame[2].to_numpy(dtype=bool), starts, 0)
+        if previous is not None and len(previous):
+            keyframe_starts[0] = max(
+                keyframe_starts[0], previous.holdings_ranges[-1, 0]
+            )
+        keyframe_starts = np.maximum.accumulate(keyframe_starts)
+        times = [datetime.strptime(time, TIME_FORMAT) for time in frame[0]]
+        in_time = frame[1].to_numpy(dtype=bool)
+        values = frame.iloc[:, VALUE_OFFSET:].to_numpy(dtype=float)
+        holdings_ranges = np.column_stack(
+            [keyframe_starts, starts, frame[4].to_numpy(dtype=np.int64)]
+        )
+        if previous is not None:
+            # Players who joined since get NaN columns in the older rows
+            earlier = np.full((len(previous), len(players)), np.nan)
+            earlier[:, : previous.values.shape[1]] = previous.values
+            times = previous.times + times
+            in_time = np.concatenate([previous.in_time, in_time])
+            values = np.concatenate([earlier, values])
+            holdings_ranges = np.concatenate(
+                [previous.holdings_ranges, holdings_ranges]
+            )
+        return History(
+            self,
+            times,
+            in_time,
+            [name for name, _url in players],
+            [url for _name, url in players],
+            values,
+            holdings_ranges,
+        )
+
+    def load(self):
+        if not self.exists():
+            self.migrate()
+        players, frame, _end = self._read_values()
+        if frame is None:
+            frame = pd.DataFrame(columns=range(VALUE_OFFSET + len(players)))
+        return self._history(players, frame)
+
+    def migrate(self, leaderboards_dir=LEADERBOARDS_DIR):
+        """Build the store from the in_time and out_of_time JSON snapshots
+
+        Loose and archived snapshots alike, see snapshot_archive.py.
+        """
+        if self.exists():
+            print(f"{self.directory} already exists, not migrating again")
+            return
+        snapshots = list_snapshots(leaderboards_dir=leaderboards_dir)
+        print(f"Migrating {len(snapshots)} snapshots into {self.directory}")
+        for snapshot, data in load_snapshots(snapshots, leaderboards_dir):
+            self.append(
+                data, snapshot_time(snapshot.name), snapshot.bucket == "in_time"
+            )
+
+
+# directory -> (History, values.csv inode, bytes of it read)
+_shared = {}
+
+
+def shared_history(directory=HISTORY_DIR):
+    """The History in `directory`, loaded once per process
+
+    Later calls only read the snapshots appended since the last one, so the
+    daemon, the renderers and the bot don't re-read the whole season every
+    cycle. Don't modify what it returns, everybody gets the same object.
+    """
+    store = HistoryStore(directory)
+    if not store.exists():
+        store.migrate()
+    inode = os.stat(store.path(VALUES_FILE)).st_ino
+    history, cached_inode, offset = _shared.get(directory, (None, None, 0))
+    if inode != cached_inode:
+        # First load, or the store was rebuilt since
+        history, offset = None, 0
+    players, frame, offset = store._read_values(offset)
+    if frame is not None:
+        history = store._history(players, frame, history)
+    elif history is None:
+        history = store.load()
+    _shared[directory] = (history, inode, offset)
+    return history
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        HistoryStore().migrate()
+    else:
+        print(f"usage: python {sys.argv[0]} migrate")
@@ -0,0 +1,68 @@
+"""Typed holding record shared by the scraper, the history and the bot
+
+Holdings used to be kept as the display strings the portfolio table shows
+("$6,795.00", "28.18%") and re-parsed everywhere they were used. The scraper
+now parses them once into a Holding, snapshots store it as a plain
+[symbol, amount, gain] list of numbers, and formatting only happens where
+something is shown. parse_holding still reads every older snapshot format.
+"""
+
+from collections import namedtuple
+
+# amount is the position's market value in dollars, gain its total gain in
+# percent; either is None when an old snapshot didn't record it
+Holding = namedtuple("Holding", ["symbol", "amount", "gain"])
+
+# Cost basis has to move by more than this to count as a trade, the rounding
+# of the displayed gain % alone moves it a little
+COST_BASIS_TOLERANCE = 0.005
+
+
+def parse_money(text):
+    return float(str(text).replace("$", "").replace(",", ""))
+
+
+def parse_percent(text):
+    return float(str(text).replace("%", ""))
+
+
+def parse_holding(raw):
+    """A Holding from any format a snapshot has stored, None for placeholders
+
+    Reads [symbol, amount, gain] numbers, the older ["AHR", "$6,795.00",
+    "28.18%"] strings and the bare "AHR" symbols of the earliest snapshots.
+    """
+    if isinstance(raw, str):
+        return Holding(raw, None, None)
+    if len(raw) < 3:
+        return None
+    try:
+        return Holding(raw[0], parse_money(raw[1]), parse_percent(raw[2]))
+    except ValueError:
+        return Holding(raw[0], None, None)
+
+
+def parse_holdings(raw_holdings):
+    return [
+        holding
+        for holding in map(parse_holding, raw_holdings or [])
+        if holding is not None
+    ]
+
+
+def cost_basis(amount, gain):
+    """What was paid for a position, from its current value and gain %"""
+    return amount / (1 + gain / 100) if gain > -100 else amount
+
+
+def resized(previous, current):
+    """Whether the cost basis moved enough to mean shares were bought or sold"""
+    return abs(current - previous) > COST_BASIS_TOLERANCE * max(abs(previous), 1)
+
+
+def format_amount(amount):
+    return "?" if amount is None else "${:,.2f}".format(amount)
+
+
+def format_gain(gain):
+    return "?" if gain is None else "{:.2f}%".format(gain)
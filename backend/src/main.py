@@ -4,14 +4,58 @@ from datetime import datetime
 import pickle
 import random
 import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlparse
 from playwright.async_api import async_playwright
 
 import pytz
 from dotenv import load_dotenv
-from make_webpage import make_index_page, make_user_pages, make_user_page
+from adaptive_limiter import AdaptiveLimiter
+from history_db import HistoryDB
+from history_store import HistoryStore, shared_history
+from holding import parse_holding, parse_money
+from make_webpage import make_user_page, make_user_pages, write_index_page
+from page_network import JsonCapture, enable_resource_blocking
+from refresh_scheduler import RefreshScheduler
+from render_cache import RenderCache
+from replay import LOGIN_FORM_URL, record_page
+from retry_policy import FailedAccounts, RetryPolicy, carry_forward
+from scrape_metrics import AttemptTimer, ScrapeMetrics
+from snapshot_archive import record_snapshot
+from trading_calendar import is_in_session, is_trading_day
 
 load_dotenv()
 
+# Where the simulator lives, point this at `python ./backend/src/replay.py` to
+# scrape recorded pages offline; SCRAPER_RECORD=True saves pages for replaying
+INVESTOPEDIA_BASE_URL = os.environ.get(
+    "INVESTOPEDIA_BASE_URL", "https://www.investopedia.com"
+).rstrip("/")
+SCRAPER_RECORD = os.environ.get("SCRAPER_RECORD") == "True"
+
+# Opt-in: block images/fonts/third party hosts and read the portfolio from the
+# simulator's own JSON responses when they carry it before the DOM does
+LIGHTWEIGHT_SCRAPE = os.environ.get("LIGHTWEIGHT_SCRAPE") == "True"
+
+# Number of worker processes (each with its own browser) to split the roster
+# across, and the starting / maximum number of tabs per browser
+SCRAPER_SHARDS = int(os.environ.get("SCRAPER_SHARDS", "1"))
+SCRAPER_CONCURRENCY = int(os.environ.get("SCRAPER_CONCURRENCY", "8"))
+SCRAPER_MAX_CONCURRENCY = int(os.environ.get("SCRAPER_MAX_CONCURRENCY", "16"))
+SCRAPER_TARGET_LATENCY = float(os.environ.get("SCRAPER_TARGET_LATENCY", "30"))
+
+# How many times / how long one account may be tried before it gives up and
+# its last known value is carried forward instead
+SCRAPER_MAX_ATTEMPTS = int(os.environ.get("SCRAPER_MAX_ATTEMPTS", "3"))
+SCRAPER_ATTEMPT_TIMEOUT = float(os.environ.get("SCRAPER_ATTEMPT_TIMEOUT", "120"))
+SCRAPER_RUN_FAILURE_BUDGET = int(os.environ.get("SCRAPER_RUN_FAILURE_BUDGET", "10"))
+
+# Opt-in: scrape dormant accounts less often and carry their last entry forward
+TIERED_REFRESH = os.environ.get("TIERED_REFRESH") == "True"
+
 # Add list of user agents
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -27,6 +71,13 @@ def get_random_user_agent():
 
 
 # --- functions ---  # PEP8: `lower_case_names`
+def site_url(url):
+    """Point a simulator url or path at INVESTOPEDIA_BASE_URL"""
+    parsed = urlparse(url)
+    query = f"?{parsed.query}" if parsed.query else ""
+    return f"{INVESTOPEDIA_BASE_URL}{parsed.path}{query}"
+
+
 async def save_cookies(context, path):
     cookies = await context.cookies()
     with open(path, "wb") as file:
@@ -34,32 +85,37 @@ async def save_cookies(context, path):
 
 
 async def load_cookies(context, path):
+    if not os.path.exists(path):
+        return False
     with open(path, "rb") as file:
         cookies = pickle.load(file)
         await context.add_cookies(cookies)
     return True
 
 
-async def login(page):
+async def login(page, use_cookies=True):
     INVESTOPEDIA_EMAIL = os.environ.get("INVESTOPEDIA_EMAIL")
     INVESTOPEDIA_PASSWORD = os.environ.get("INVESTOPEDIA_PASSWORD")
     COOKIE_PATH = "./backend/cookies.pkl"
 
-    # First try to use cookies
-    await page.goto("https://www.investopedia.com/simulator", wait_until="networkidle")
-    if await load_cookies(page.context, COOKIE_PATH):
-        await page.goto(
-            "https://www.investopedia.com/simulator/home.aspx", wait_until="networkidle"
-        )
+    # First try to use cookies, unless recording, which needs the login form
+    await page.goto(site_url("/simulator"), wait_until="networkidle")
+    if SCRAPER_RECORD:
+        await record_page(page, "/simulator")
+        use_cookies = False
+    if use_cookies and await load_cookies(page.context, COOKIE_PATH):
+        await page.goto(site_url("/simulator/home.aspx"), wait_until="networkidle")
         # Check if we're logged in
         login_button = await page.query_selector("#login")
         if not login_button:
+            if SCRAPER_RECORD:
+                await record_page(page, "/simulator/home.aspx")
             return
 
     # If cookies didn't work, do regular login
-    await page.goto(
-        "https://www.investopedia.com/simulator/home.aspx", wait_until="networkidle"
-    )
+    await page.goto(site_url("/simulator/home.aspx"), wait_until="networkidle")
+    if SCRAPER_RECORD:
+        await record_page(page, LOGIN_FORM_URL)
 
     await page.fill("#username", INVESTOPEDIA_EMAIL)
     await page.fill("#password", INVESTOPEDIA_PASSWORD)
@@ -68,6 +124,48 @@ async def login(page):
 
     # Save cookies after successful login
     await save_cookies(page.context, COOKIE_PATH)
+    if SCRAPER_RECORD:
+        await page.goto(site_url("/simulator/home.aspx"), wait_until="networkidle")
+        await record_page(page, "/simulator/home.aspx")
+
+
+async def is_logged_out(page):
+    """Cheap check for whether the current page bounced us to the login form"""
+    return await page.evaluate(
+        "() => !!document.querySelector('#login') || /login/i.test(location.pathname)"
+    )
+
+
+class LoginSession:
+    """Logs a browser context in once and only logs in again when a page comes back logged out"""
+
+    def __init__(self, context):
+        self.context = context
+        self.lock = asyncio.Lock()
+        self.generation = 0
+
+    async def _login(self, use_cookies):
+        page = await self.context.new_page()
+        try:
+            await login(page, use_cookies=use_cookies)
+        finally:
+            await page.close()
+        self.generation += 1
+
+    async def ensure(self):
+        """Log in if this context has not been logged in yet"""
+        async with self.lock:
+            if self.generation == 0:
+                await self._login(use_cookies=True)
+
+    async def relogin(self, seen_generation):
+        """Do a fresh login, unless another tab already did one since seen_generation"""
+        async with self.lock:
+            if self.generation != seen_generation:
+                return
+            print("Session expired, logging in again...")
+            await self.context.clear_cookies()
+            await self._login(use_cookies=False)
 
 
 # Add after imports
@@ -75,106 +173,139 @@ SCREENSHOT_DIR = "./backend/screenshots"
 os.makedirs(SCREENSHOT_DIR, exist_ok=True)
 
 
-async def process_single_account(context, url):
+# Pulls the account value, portfolio name and the symbol / total value / gain
+# cells of every holdings row in one evaluate call instead of one Playwright
+# round trip per cell
+EXTRACT_ACCOUNT_JS = """
+() => {
+    const text = (el) => (el ? el.textContent : null);
+    const rows = Array.from(document.querySelectorAll('table tr'));
+    return {
+        accountValue: text(document.querySelector('[data-cy="account-value-text"]')),
+        portfolioName: text(document.querySelector('[data-cy="user-portfolio-name"]')),
+        rowCount: rows.length,
+        rows: rows.slice(1).map((row) => [
+            text(row.querySelector('td:nth-child(1)')),
+            text(row.querySelector('td:nth-child(7)')),
+            text(row.querySelector('td:nth-child(8)')),
+        ]),
+    };
+}
+"""
+
+
+def parse_holdings_rows(rows):
+    """Turn raw [symbol, total value, gain] cell texts into Holdings"""
+    stock_data = []
+    for symbol, total_amount_of_money, gain_pct in rows:
+        if symbol is None or total_amount_of_money is None or gain_pct is None:
+            continue
+        symbol_text = symbol.strip()
+        price_text = total_amount_of_money.strip()
+        gain_text = gain_pct.strip()
+        # Clean up gain percentage text
+        gain_text = gain_text.replace("\n", "").replace(" ", "")
+        gain_parts = gain_text.split("(")
+        if len(gain_parts) > 1:
+            gain_text = gain_parts[1].replace(")", "")
+        if symbol_text and price_text and gain_text:
+            stock_data.append(parse_holding([symbol_text, price_text, gain_text]))
+    return stock_data
+
+
+async def process_single_account(context, url, session, capture_json=False, timer=None):
     """Process a single account and return its information"""
+    timer = timer or AttemptTimer(url, 1)
     page = await context.new_page()
+    capture = JsonCapture(page) if capture_json or SCRAPER_RECORD else None
 
     try:
-        # First attempt
-        await login(page)
-        await page.goto(url, wait_until="domcontentloaded")
+        # First attempt, reusing the context's existing login
+        with timer.phase("login"):
+            await session.ensure()
+        generation = session.generation
+        with timer.phase("navigation"):
+            await page.goto(site_url(url), wait_until="domcontentloaded")
         print(page.url)
-        account_name = ""
+        if capture_json:
+            with timer.phase("selector_wait"):
+                # Race the payloads against the DOM, so a payload that doesn't
+                # carry the portfolio costs no time over the DOM path
+                portfolio = await capture.wait_for_portfolio(
+                    page.wait_for_selector(
+                        '[data-cy="account-value-text"], #login', timeout=300000
+                    )
+                )
+            if portfolio is not None:
+                timer.source = "json"
+                account_name, account_value, stock_data = portfolio
+                print(f"\nProcessing account: {account_name} (from JSON response)")
+                return account_name.strip(), [account_value, url.strip(), stock_data]
         try:
-            # Wait for account value and name to be present
-            await page.wait_for_selector(
-                '[data-cy="account-value-text"]', timeout=300000
-            )
-            await page.wait_for_selector(
-                '[data-cy="user-portfolio-name"]', timeout=300000
-            )
-
-            account_value = await page.text_content('[data-cy="account-value-text"]')
-            account_value = float(account_value.replace("$", "").replace(",", ""))
-            account_name = await page.text_content('[data-cy="user-portfolio-name"]')
-            account_name = account_name.replace(" Portfolio", "").strip()
+            with timer.phase("selector_wait"):
+                # Wait for either the account value or the login form to show up
+                await page.wait_for_selector(
+                    '[data-cy="account-value-text"], #login', timeout=300000
+                )
+                if await is_logged_out(page):
+                    raise Exception("page came back logged out")
+                await page.wait_for_selector(
+                    '[data-cy="user-portfolio-name"]', timeout=300000
+                )
         except Exception as e:
+            # Logging in again clears the cookies of every tab, so only do it
+            # when this page really was logged out, anything else is retried
+            if not await is_logged_out(page):
+                raise
             print("First attempt failed, trying again with fresh login...")
-            await context.clear_cookies()
-            await login(page)
-            await page.goto(url, wait_until="domcontentloaded")
-
-            # Wait for account value and name to be present on second attempt
-            await page.wait_for_selector(
-                '[data-cy="account-value-text"]', timeout=300000
-            )
-            await page.wait_for_selector(
-                '[data-cy="user-portfolio-name"]', timeout=300000
-            )
-
-            account_value = await page.text_content('[data-cy="account-value-text"]')
-            account_value = float(account_value.replace("$", "").replace(",", ""))
-            account_name = await page.text_content('[data-cy="user-portfolio-name"]')
-            account_name = account_name.replace(" Portfolio", "").strip()
+            with timer.phase("login"):
+                await session.relogin(generation)
+            with timer.phase("navigation"):
+                await page.goto(site_url(url), wait_until="domcontentloaded")
+
+            with timer.phase("selector_wait"):
+                # Wait for account value and name to be present on second attempt
+                await page.wait_for_selector(
+                    '[data-cy="account-value-text"]', timeout=300000
+                )
+                await page.wait_for_selector(
+                    '[data-cy="user-portfolio-name"]', timeout=300000
+                )
             with open("logs/log.txt", "a") as file:
                 file.write(
                     f" {datetime.now()} First attempt failed, trying again with fresh login, specific error was {e}\n"
                 )
-        # Wait for table to be fully loaded
-        await page.wait_for_selector(
-            "table tr td", timeout=300000
-        )  # Wait for at least one table cell
-        await page.wait_for_function(
-            """
-            () => {
-                const rows = document.querySelectorAll('table tr');
-                return rows.length > 1 && rows[1].querySelectorAll('td').length > 0;
-            }
-        """,
-            timeout=300000,
-        )
+        with timer.phase("selector_wait"):
+            # Wait for table to be fully loaded
+            await page.wait_for_selector(
+                "table tr td", timeout=300000
+            )  # Wait for at least one table cell
+            await page.wait_for_function(
+                """
+                () => {
+                    const rows = document.querySelectorAll('table tr');
+                    return rows.length > 1 && rows[1].querySelectorAll('td').length > 0;
+                }
+            """,
+                timeout=300000,
+            )
 
-        # Get stock data from table
-        stock_data = []
-        rows = await page.query_selector_all("table tr")
+        with timer.phase("table_parse"):
+            # Get stock data from table in a single round trip
+            extracted = await page.evaluate(EXTRACT_ACCOUNT_JS)
+            account_value = parse_money(extracted["accountValue"])
+            account_name = extracted["portfolioName"].replace(" Portfolio", "").strip()
+            stock_data = parse_holdings_rows(extracted["rows"])
 
         print(f"\nProcessing account: {account_name}")
-        print("Table rows found:", len(rows))
-
-        if len(rows) > 1:  # Skip header row
-            for i, row in enumerate(rows[1:], 1):
-                try:
-                    # # Print entire row content for debugging
-                    # all_cells = await row.query_selector_all("td")
-                    # raw_row_data = []
-                    # for cell in all_cells:
-                    #     content = await cell.text_content()
-                    #     raw_row_data.append(content.strip())
-                    # print(f"Row {i} raw data:", raw_row_data)
-
-                    symbol = await row.query_selector("td:nth-child(1)")
-                    total_amount_of_money = await row.query_selector("td:nth-child(7)")
-                    gain_pct = await row.query_selector("td:nth-child(8)")
-                    # print(await symbol.text_content(), await last_price.text_content(), await gain_pct.text_content())
-                    if symbol and total_amount_of_money and gain_pct:
-                        symbol_text = (await symbol.text_content()).strip()
-                        price_text = (
-                            await total_amount_of_money.text_content()
-                        ).strip()
-                        gain_text = (await gain_pct.text_content()).strip()
-                        # Clean up gain percentage text
-                        gain_text = gain_text.replace("\n", "").replace(" ", "")
-                        gain_parts = gain_text.split("(")
-                        if len(gain_parts) > 1:
-                            gain_text = gain_parts[1].replace(")", "")
-                        if symbol_text and price_text and gain_text:
-                            stock_data.append([symbol_text, price_text, gain_text])
-                            print(
-                                f"Processed stock for {account_name}: {symbol_text}____{price_text}____ {gain_text}"
-                            )
-                except Exception as e:
-                    print(f"Error parsing row: {e}")
-                    continue
+        print("Table rows found:", extracted["rowCount"])
+        for holding in stock_data:
+            print(
+                f"Processed stock for {account_name}: {holding.symbol}____{holding.amount}____ {holding.gain}"
+            )
+
+        if SCRAPER_RECORD:
+            await record_page(page, url, capture.responses)
 
         # if not stock_data:
         #     # Take a screenshot if no stocks are discovered
@@ -191,6 +322,7 @@ async def process_single_account(context, url):
             stock_data,
         ]  # Added strip()
     except Exception as e:
+        timer.error = str(e)
         print(f"Error processing account {url}: {str(e)}")
         with open("logs/log.txt", "a") as file:
             file.write(f"Error processing account {url}: {str(e)}, {datetime.now()}\n")
@@ -204,40 +336,186 @@ async def process_single_account(context, url):
         await page.close()  # Close tab instead of browser
 
 
-async def get_account_information():
-    """Returns a dictionary with all of the account values within it"""
-    account_information = {}
-    urls = []
+async def open_scraper(p, lightweight=LIGHTWEIGHT_SCRAPE):
+    """Launch a browser and a context for scraping, returns (browser, context, session)"""
+    browser = await p.chromium.launch(headless=True)
+    context = await browser.new_context(user_agent=get_random_user_agent())
+    if lightweight:
+        await enable_resource_blocking(context)
+    return browser, context, LoginSession(context)
 
-    with open("./backend/portfolios/portfolios.txt", "r") as file:
-        urls = [line.strip() for line in file]
 
-    # Create semaphore to limit concurrent tabs
-    semaphore = asyncio.Semaphore(8)  # Reduced from 16 since we're using tabs
+async def scrape_with_context(
+    context, session, urls, lightweight=LIGHTWEIGHT_SCRAPE, metrics=None
+):
+    """Scrape a list of portfolio urls as tabs of an already open context"""
+    account_information = {}
+    metrics = metrics or ScrapeMetrics()
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(user_agent=get_random_user_agent())
-
-        async def process_with_semaphore(url):
-            async with semaphore:
-                res = await process_single_account(context, url)
-                while res == "retry":
-                    print("Retrying...", url)
-                    res = await process_single_account(context, url)
+    # Limit concurrent tabs, adapting to how quickly pages are coming back
+    limiter = AdaptiveLimiter(
+        initial=SCRAPER_CONCURRENCY,
+        maximum=SCRAPER_MAX_CONCURRENCY,
+        target_latency=SCRAPER_TARGET_LATENCY,
+    )
+    retry_policy = RetryPolicy(
+        max_attempts=SCRAPER_MAX_ATTEMPTS,
+        run_failure_budget=SCRAPER_RUN_FAILURE_BUDGET,
+    )
+
+    async def attempt(url, attempt_number):
+        await limiter.acquire()
+        try:
+            timer = metrics.attempt(url, attempt_number)
+            start = time.monotonic()
+            try:
+                res = await asyncio.wait_for(
+                    process_single_account(context, url, session, lightweight, timer),
+                    SCRAPER_ATTEMPT_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                print(f"Timed out after {SCRAPER_ATTEMPT_TIMEOUT}s: {url}")
+                timer.error = f"timed out after {SCRAPER_ATTEMPT_TIMEOUT}s"
+                res = "retry"
+            await limiter.record(time.monotonic() - start, res != "retry")
+            metrics.add(timer.record(res != "retry"))
+            return res
+        finally:
+            await limiter.release()
+
+    async def process_with_limiter(url):
+        attempt_number = 0
+        while True:
+            attempt_number += 1
+            res = await attempt(url, attempt_number)
+            if res != "retry":
                 return res
+            if attempt_number >= retry_policy.attempts_allowed():
+                break
+            # Back off outside of the tab slot so other accounts keep going
+            delay = retry_policy.delay(attempt_number)
+            print(f"Retrying in {delay:.1f}s...", url)
+            await asyncio.sleep(delay)
+
+        retry_policy.gave_up()
+        metrics.gave_up.append(url)
+        print(f"Giving up on {url} after {attempt_number} attempts")
+        with open("logs/log.txt", "a") as file:
+            file.write(
+                f"Gave up on account {url} after {attempt_number} attempts, {datetime.now()}\n"
+            )
+        return None
 
+    # Log in once up front so every tab starts with a valid session
+    with metrics.run_phase("login"):
         try:
-            tasks = [process_with_semaphore(url) for url in urls]
-            results = await asyncio.gather(*tasks)
+            await session.ensure()
+        except Exception as e:
+            # Every account gives up, the caller carries their last values
+            # forward so the run still writes a snapshot
+            print(f"Login failed, giving up on all {len(urls)} accounts: {e}")
+            with open("logs/log.txt", "a") as file:
+                file.write(f"Login failed: {e}, {datetime.now()}\n")
+            metrics.gave_up.extend(urls)
+            return account_information
+    tasks = [process_with_limiter(url) for url in urls]
+    results = await asyncio.gather(*tasks)
+
+    for result in results:
+        if result:
+            account_name, account_data = result
+            account_information[account_name] = account_data
+    return account_information
 
-            for result in results:
-                if result:
-                    account_name, account_data = result
-                    account_information[account_name] = account_data
+
+async def scrape_accounts(urls, lightweight=LIGHTWEIGHT_SCRAPE, metrics=None):
+    """Scrape a list of portfolio urls with a fresh browser and context"""
+    async with async_playwright() as p:
+        with metrics.run_phase("browser_launch") if metrics else nullcontext():
+            browser, context, session = await open_scraper(p, lightweight)
+        try:
+            return await scrape_with_context(
+                context, session, urls, lightweight, metrics
+            )
         finally:
             await browser.close()
 
+
+def scrape_shard(urls, lightweight):
+    """Worker process entry point, scrapes one shard of the roster
+
+    Returns the shard's account information and its ScrapeMetrics.
+    """
+    metrics = ScrapeMetrics()
+    account_information = asyncio.run(scrape_accounts(urls, lightweight, metrics))
+    return account_information, metrics
+
+
+async def get_account_information(
+    lightweight=LIGHTWEIGHT_SCRAPE,
+    shards=SCRAPER_SHARDS,
+    scrape=None,
+    tiered=TIERED_REFRESH,
+):
+    """Returns a dictionary with all of the account values within it
+
+    `scrape` can be an async callable taking the list of urls and a
+    ScrapeMetrics to use an already running browser instead of launching one
+    (see daemon.py).
+    """
+    metrics = ScrapeMetrics()
+    with open("./backend/portfolios/portfolios.txt", "r") as file:
+        all_urls = [line.strip() for line in file if line.strip()]
+
+    # Skip urls that have kept failing over the last few runs
+    failed_accounts = FailedAccounts()
+    urls = [url for url in all_urls if not failed_accounts.should_skip(url)]
+    for url in set(all_urls) - set(urls):
+        print(f"Skipping {url}, it has been failing repeatedly")
+
+    if tiered:
+        scheduler = RefreshScheduler()
+        now = datetime.now(pytz.timezone("America/New_York")).replace(tzinfo=None)
+        urls = scheduler.select(urls, now)
+
+    shards = max(1, min(shards, len(urls)))
+    if scrape is not None:
+        account_information = await scrape(urls, metrics)
+    elif shards == 1:
+        account_information = await scrape_accounts(urls, lightweight, metrics)
+    else:
+        # Split the roster round-robin so every shard gets a similar mix of accounts
+        account_information = {}
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(
+            max_workers=shards, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            shard_results = await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        pool, scrape_shard, urls[i::shards], lightweight
+                    )
+                    for i in range(shards)
+                ]
+            )
+        for shard_information, shard_metrics in shard_results:
+            account_information.update(shard_information)
+            metrics.merge(shard_metrics)
+
+    succeeded_urls = {account_data[1] for account_data in account_information.values()}
+    failed_accounts.update(succeeded_urls, set(urls) - succeeded_urls)
+    failed_accounts.save()
+    if tiered:
+        scheduler.refreshed(account_information, urls, now)
+        scheduler.save()
+
+    # Accounts that gave up or were skipped keep their last known value
+    scraped_count = len(account_information)
+    account_information = carry_forward(
+        account_information, set(all_urls) - succeeded_urls
+    )
+    metrics.carried_forward = len(account_information) - scraped_count
+    metrics.write()
     return account_information
 
 
@@ -247,42 +525,80 @@ def generate_user_page(user):
         file.write(make_user_page(user))
 
 
+def in_update_window(curr_time):
+    """Whether curr_time (New York time) falls in the window we scrape in
+
+    Same definition sort_leaderboards.py uses for in_time snapshots.
+    """
+    return is_in_session(curr_time)
+
+
+def should_update(curr_time):
+    return (
+        in_update_window(curr_time) or os.environ.get("FORCE_UPDATE") == "True"
+    ) and os.environ.get("DONT_UPDATE") != "True"
+
+
+def save_leaderboard(account_values, curr_time):
+    """Write a scrape to leaderboard-latest.json and the in_time/out_of_time history"""
+    in_time = in_update_window(curr_time)
+    bucket = "in_time" if in_time else "out_of_time"
+    snapshot_path = f"{bucket}/leaderboard-{curr_time.strftime('%Y-%m-%d-%H_%M')}.json"
+    content = json.dumps(account_values)
+
+    with open("./backend/leaderboards/leaderboard-latest.json", "w") as file:
+        file.write(content)
+
+    with open(f"./backend/leaderboards/{snapshot_path}", "w") as file:
+        file.write(content)
+    record_snapshot(snapshot_path, content.encode())
+
+    # The first append migrates the JSON history above into the store
+    store = HistoryStore()
+    if not store.exists():
+        store.migrate()
+    else:
+        store.append(account_values, curr_time, in_time)
+
+    # The SQLite index is only a cache of the store, a failed sync is caught
+    # up on by the next one
+    try:
+        db = HistoryDB()
+        db.sync(shared_history())
+        db.close()
+    except Exception as e:
+        print(f"Syncing the history database failed: {e}")
+        with open("logs/log.txt", "a") as file:
+            file.write(f"History database sync failed: {e}, {datetime.now()}\n")
+
+
+def render_pages():
+    """Regenerate index.html and every player page"""
+    history = shared_history()
+    # Only pages whose inputs changed since the last render get written
+    cache = RenderCache()
+    # Update index.html
+    write_index_page(history, cache)
+
+    # Read usernames and generate all pages at once
+    with open("./backend/portfolios/usernames.txt", "r") as file:
+        usernames = [user.strip() for user in file.readlines()]
+        make_user_pages(usernames, history, cache)
+    cache.save()
+
+
 # Main execution block
 async def main():
     tz_NY = pytz.timezone("America/New_York")
     curr_time = datetime.now(tz_NY)
 
-    if curr_time.weekday() < 5:
-        if (
-            (
-                (curr_time.hour > 9 or (curr_time.hour == 9 and curr_time.minute >= 30))
-                and curr_time.hour < 17
-            )
-            or os.environ.get("FORCE_UPDATE") == "True"
-        ) and os.environ.get("DONT_UPDATE") != "True":
+    if is_trading_day(curr_time):
+        if should_update(curr_time):
             account_values = await get_account_information()
-
-            file_name = f"./backend/leaderboards/out_of_time/leaderboard-{curr_time.strftime('%Y-%m-%d-%H_%M')}.json"
-            if (
-                curr_time.hour > 9 or (curr_time.hour == 9 and curr_time.minute >= 30)
-            ) and curr_time.hour < 17:
-                file_name = f"./backend/leaderboards/in_time/leaderboard-{curr_time.strftime('%Y-%m-%d-%H_%M')}.json"
-
-            with open("./backend/leaderboards/leaderboard-latest.json", "w") as file:
-                json.dump(account_values, file)
-
-            with open(file_name, "w") as file:
-                json.dump(account_values, file)
+            save_leaderboard(account_values, curr_time)
         else:
             print("Update disabled")
-        # Update index.html
-        with open("index.html", "w") as file:
-            file.write(make_index_page())
-
-        # Read usernames and generate all pages at once
-        with open("./backend/portfolios/usernames.txt", "r") as file:
-            usernames = [user.strip() for user in file.readlines()]
-            make_user_pages(usernames)
+        render_pages()
 
 
 if __name__ == "__main__":
@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 from collections import Counter
@@ -5,16 +6,29 @@ from datetime import datetime, timedelta
 from glob import glob
 
 import flask
+import numpy as np
 import pandas as pd
 from babel.numbers import format_currency
 from flask import render_template
 from scipy.stats import zscore
 from zoneinfo import ZoneInfo
-import yfinance as yf
+
+from benchmark import sp500_values
+from history_db import HistoryDB
+from history_store import shared_history
+from render_cache import RenderCache
+from roster import load_roster
+from trading_calendar import trading_timestamps
 
 # this whole file is to render the html table
 app = flask.Flask("leaderboard")
 
+# The index chart's series, in the column order of index_page_context's grid
+CHART_SERIES = ("min", "max", "q1", "median", "q3", "sp500")
+
+# Where the player pages fetch their chart series from, under the site root
+CHART_DATA_DIR = "data"
+
 
 def get_five_number_summary(df):
     average_money = df["Money In Account"].mean()
@@ -26,210 +40,202 @@ def get_five_number_summary(df):
 
 
 def generate_trading_timestamps(start_date, end_date):
-    """Generate 5-minute interval timestamps during trading hours (9:30 AM - 4:00 PM EST)"""
-    timestamps = []
-    current = start_date.replace(hour=9, minute=30, second=0, microsecond=0)
-
-    while current <= end_date:
-        # Skip weekends
-        if current.weekday() < 5:  # Monday = 0, Friday = 4
-            # Add timestamps for the trading day (9:30 AM - 4:00 PM EST)
-            day_time = current
-            while day_time.hour < 16 or (day_time.hour == 16 and day_time.minute == 0):
-                timestamps.append(day_time)
-                day_time += timedelta(minutes=5)
-
-        # Move to next day
-        current = (current + timedelta(days=1)).replace(
-            hour=9, minute=30, second=0, microsecond=0
-        )
+    """Generate 5-minute interval timestamps during trading hours (9:30 AM - 4:00 PM EST)
+
+    Holidays are skipped and early close days stop at the early close, see
+    trading_calendar.py.
+    """
+    return trading_timestamps(start_date, end_date, timedelta(minutes=5))
+
+
+def epoch_seconds(times):
+    """Aware datetimes as an array of seconds since the epoch"""
+    return np.array([time.timestamp() for time in times], dtype=float)
+
+
+def resample(data_times, data_values, target_times):
+    """Linearly interpolate every column of data_values onto target_times
+
+    data_times and target_times are sorted epoch seconds, data_values has a
+    row per data time. Targets outside the data hold the nearest value, and
+    NaN values stay NaN in the slots next to them.
+    """
+    data_values = np.asarray(data_values, dtype=float)
+    last = len(data_times) - 1
+    # The data points on either side of each target, the same one on an
+    # exact match or past either end
+    before = np.clip(np.searchsorted(data_times, target_times, "right") - 1, 0, last)
+    after = np.clip(np.searchsorted(data_times, target_times, "left"), 0, last)
+    span = data_times[after] - data_times[before]
+    ratio = np.divide(
+        target_times - data_times[before],
+        span,
+        out=np.zeros(len(target_times)),
+        where=span > 0,
+    )
+    low = data_values[before]
+    return low + ratio[:, None] * (data_values[after] - low)
 
-    return timestamps
 
+def json_column(column, kind=float):
+    """A matrix column as a list for JSON, NaN (missing) becomes None"""
+    return [None if np.isnan(x) else kind(x) for x in column.tolist()]
 
-def interpolate_value(timestamps, data_times, data_values, target_time):
-    """Interpolate value for a given timestamp using surrounding data points"""
-    if not data_times or not data_values:
-        return None
 
-    # Find the closest points before and after target_time
-    before_idx = None
-    after_idx = None
+def chart_payload(times, series):
+    """The index chart's data as one columnar JSON object, see index.html
 
-    for i, time in enumerate(data_times):
-        if time <= target_time:
-            before_idx = i
-        if time >= target_time:
-            after_idx = i
-            break
+    {"time": [epoch seconds], <name>: [value per time]} for every name in
+    CHART_SERIES, read by the chart in one pass. Values are rounded to the
+    cent and missing ones are null.
+    """
+    payload = {"time": times.astype(int).tolist()}
+    for name, column in zip(CHART_SERIES, np.round(series, 2).T):
+        payload[name] = json_column(column)
+    return json.dumps(payload, separators=(",", ":"))
 
-    if before_idx is None or after_idx is None:
-        return (
-            data_values[before_idx]
-            if before_idx is not None
-            else data_values[after_idx]
-        )
 
-    if before_idx == after_idx:
-        return data_values[before_idx]
+def update_time():
+    return (
+        datetime.utcnow()
+        .astimezone(ZoneInfo("US/Pacific"))
+        .strftime("%H:%M:%S %m-%d-%Y")
+    )
 
-    # Linear interpolation
-    time_diff = (data_times[after_idx] - data_times[before_idx]).total_seconds()
-    target_diff = (target_time - data_times[before_idx]).total_seconds()
-    ratio = target_diff / time_diff
 
-    return data_values[before_idx] + ratio * (
-        data_values[after_idx] - data_values[before_idx]
+def snapshot_update_time(when):
+    """update_time() for a (naive New York) snapshot time"""
+    return (
+        when.replace(tzinfo=ZoneInfo("America/New_York"))
+        .astimezone(ZoneInfo("US/Pacific"))
+        .strftime("%H:%M:%S %m-%d-%Y")
     )
 
 
-def make_index_page():
+def write_chart_series(labels, sp500_prices, updated):
+    """Write the time axis and S&P 500 series every player page shares
+
+    Returns the file's name, which is a hash of its content, so browsers can
+    cache it for good and only fetch it again when a snapshot is added.
+    """
+    content = json.dumps(
+        {
+            "labels": labels,
+            # JSON has no NaN
+            "sp500": [None if x is None or np.isnan(x) else x for x in sp500_prices],
+            "updated": updated,
+        },
+        separators=(",", ":"),
+    )
+    name = f"series-{hashlib.sha256(content.encode()).hexdigest()[:16]}.json"
+    path = os.path.join(CHART_DATA_DIR, name)
+    if not os.path.exists(path):
+        os.makedirs(CHART_DATA_DIR, exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+    return name
+
+
+def write_player_data(cache, player_name, series, player_money, player_ranks):
+    """Write a player's own chart series, see player.html"""
+    cache.write_json(
+        os.path.join(CHART_DATA_DIR, "players", f"{player_name}.json"),
+        {"series": series, "money": player_money, "ranks": player_ranks},
+    )
+
+
+def remove_stale_series():
+    """Remove the shared series files no player's data file points at any more
+
+    Players missing from the latest snapshot keep their page and data file
+    as they were, so the series those point at has to stay too.
+    """
+    referenced = set()
+    for path in glob(os.path.join(CHART_DATA_DIR, "players", "*.json")):
+        with open(path, "r") as file:
+            referenced.add(json.load(file)["series"])
+    for path in glob(os.path.join(CHART_DATA_DIR, "series-*.json")):
+        if os.path.basename(path) not in referenced:
+            os.remove(path)
+
+
+def make_index_page(history=None):
     with app.app_context():
-        leaderboard_files = sorted(glob("./backend/leaderboards/in_time/*"))
+        return render_template(
+            "index.html",
+            **index_page_context(history),
+            update_time=update_time(),
+            zip=zip,
+        )
+
+
+def write_index_page(history=None, cache=None, path="index.html"):
+    """Write index.html, unless its inputs are the same as last time (see render_cache.py)"""
+    with app.app_context():
+        save = cache is None
+        if save:
+            cache = RenderCache()
+        cache.render(
+            path,
+            "index.html",
+            index_page_context(history),
+            update_time=update_time(),
+            zip=zip,
+        )
+        if save:
+            cache.save()
+
+
+def index_page_context(history=None):
+    """Everything index.html is rendered from, apart from the update time"""
+    with app.app_context():
+        if history is None:
+            history = shared_history()
+        history = history.in_session().with_baseline(load_roster())
 
         # First collect all raw timestamps and data
         raw_timestamps = []
         raw_data = {"min": [], "max": [], "q1": [], "median": [], "q3": [], "sp500": []}
 
-        # Fetch S&P 500 data first
-        start_date = None
-        end_date = None
-        sp500 = None
-        initial_sp500_price = None
-
         # First pass to collect timestamps
-        for file in leaderboard_files:
-            file_name = os.path.basename(file)
-            date_time_str = file_name[len("leaderboard-") : -len(".json")]
-            date_time = datetime.strptime(
-                date_time_str.replace("_", ":"), "%Y-%m-%d-%H:%M"
-            ).replace(tzinfo=ZoneInfo("America/Los_Angeles"))  # Add timezone info
-            raw_timestamps.append(date_time)
-
-        if raw_timestamps:
-            start_date = min(raw_timestamps)
-            end_date = max(raw_timestamps)
-            # Add timezone info to yfinance download
-            sp500 = yf.download(
-                "SPY",
-                start=start_date.astimezone(
-                    ZoneInfo("America/New_York")
-                ),  # Convert to NY time for market hours
-                end=end_date.astimezone(ZoneInfo("America/New_York")),
-                interval="5m",
-            )
-            # Convert SP500 index to Pacific time
-            sp500.index = sp500.index.tz_convert("America/Los_Angeles")
-
-            # Get initial S&P 500 price, looking at exact timestamps
-            initial_sp500_price = None
-            for timestamp in sorted(sp500.index):
-                if timestamp >= start_date:
-                    initial_sp500_price = float(sp500.loc[timestamp, "Close"])
-                    break
-
-            if initial_sp500_price is None:
-                initial_sp500_price = float(sp500["Close"].iloc[0])
-
-        # Second pass to collect data
-        for file, timestamp in zip(leaderboard_files, raw_timestamps):
-            with open(file, "r") as f:
-                dict_leaderboard = json.load(f)
-
-            # Process leaderboard data
-            df = pd.DataFrame.from_dict(dict_leaderboard, orient="index")
-            df.reset_index(level=0, inplace=True)
-            if (
-                len(df.columns) == 3
-            ):  # IF the file has only 3 columns, then add a new column to the dataframe as a place holder
-                df["Stocks Invested In"] = [0 for i in range(len(df))]
-            df.columns = [
-                "Account Name",
-                "Money In Account",
-                "Stocks Invested In",
-                "Investopedia Link",
-            ]
-            df = df.sort_values(by=["Money In Account"], ascending=False)
-            _1, q1_money, median_money, q3_money, _2 = get_five_number_summary(
-                df
-            )  # get some key numbers for the charts
-            raw_data["min"].append(int(df["Money In Account"].min()))
-            raw_data["max"].append(int(df["Money In Account"].max()))
-            raw_data["q1"].append(int(q1_money))
-            raw_data["median"].append(int(median_money))
-            raw_data["q3"].append(int(q3_money))
-
-            # Get S&P 500 price for this timestamp
-            try:
-                # Find closest timestamp
-                closest_idx = sp500.index.get_indexer([timestamp], method="nearest")[0]
-                closest_time = sp500.index[closest_idx]
-                current_sp500_price = float(sp500.loc[closest_time, "Close"].iloc[0])
-                relative_return = current_sp500_price / initial_sp500_price
-                sp500_price = 100000 * relative_return
-            except (KeyError, IndexError):
-                sp500_price = None
-            raw_data["sp500"].append(sp500_price)
+        for date_time in history.times:
+            raw_timestamps.append(
+                date_time.replace(tzinfo=ZoneInfo("America/Los_Angeles"))
+            )  # Add timezone info
+
+        # Second pass to collect data, key numbers for the charts from every
+        # snapshot (row) of the value matrix at once
+        values = history.frame()
+        raw_data["min"] = [int(x) for x in values.min(axis=1)]
+        raw_data["max"] = [int(x) for x in values.max(axis=1)]
+        raw_data["q1"] = [int(x) for x in values.quantile(0.25, axis=1)]
+        raw_data["median"] = [int(x) for x in values.median(axis=1)]
+        raw_data["q3"] = [int(x) for x in values.quantile(0.75, axis=1)]
+        # The S&P 500 at each snapshot, lined up the same way for every page
+        raw_data["sp500"] = sp500_values(history.times)
 
         # Generate complete set of 5-minute interval timestamps
         if raw_timestamps:
             start_date = min(raw_timestamps)
             end_date = max(raw_timestamps)
             complete_timestamps = generate_trading_timestamps(start_date, end_date)
-
-            # Interpolate values for each timestamp
-            labels = []
-            min_monies = []
-            max_monies = []
-            q1_monies = []
-            median_monies = []
-            q3_monies = []
-            sp500_prices = []
-
-            for timestamp in complete_timestamps:
-                labels.append(timestamp.strftime("%Y-%m-%dT%H:%M:%S"))
-
-                # Interpolate each metric
-                min_monies.append(
-                    interpolate_value(
-                        raw_timestamps, raw_timestamps, raw_data["min"], timestamp
-                    )
-                )
-                max_monies.append(
-                    interpolate_value(
-                        raw_timestamps, raw_timestamps, raw_data["max"], timestamp
-                    )
-                )
-                q1_monies.append(
-                    interpolate_value(
-                        raw_timestamps, raw_timestamps, raw_data["q1"], timestamp
-                    )
-                )
-                median_monies.append(
-                    interpolate_value(
-                        raw_timestamps, raw_timestamps, raw_data["median"], timestamp
-                    )
-                )
-                q3_monies.append(
-                    interpolate_value(
-                        raw_timestamps, raw_timestamps, raw_data["q3"], timestamp
-                    )
-                )
-                sp500_prices.append(
-                    interpolate_value(
-                        raw_timestamps, raw_timestamps, raw_data["sp500"], timestamp
-                    )
-                )
-
+            grid_times = epoch_seconds(complete_timestamps)
+
+            # Interpolate every metric onto the 5 minute grid at once
+            series = resample(
+                epoch_seconds(raw_timestamps),
+                np.column_stack(
+                    [raw_data[key] for key in CHART_SERIES[:5]]
+                    # None (no SPY price) becomes NaN
+                    + [np.array(raw_data["sp500"], dtype=float)]
+                ),
+                grid_times,
+            )
         else:
-            # If no data, initialize empty lists
-            labels = []
-            min_monies = []
-            max_monies = []
-            q1_monies = []
-            median_monies = []
-            q3_monies = []
-            sp500_prices = []
+            grid_times = np.empty(0)
+            series = np.empty((0, len(CHART_SERIES)))
+
+        chart_data = chart_payload(grid_times, series)
 
         # Continue with existing code to render the template
         # ...existing rendering code...
@@ -299,8 +305,7 @@ def make_index_page():
             lambda x: format_currency(x, currency="USD", locale="en_US")
         )
         # Render the html template as shown here: https://stackoverflow.com/a/56296451
-        rendered = render_template(
-            "index.html",
+        return dict(
             average_money="${:,.2f}".format(average_money),
             q1_money="${:,.2f}".format(q1_money),
             median_money="${:,.2f}".format(median_money),
@@ -309,288 +314,145 @@ def make_index_page():
             column_names=column_names,  # Updated column names
             row_data=list(df.values.tolist()),
             link_column="Account Link",  # Update link column
-            update_time=datetime.utcnow()
-            .astimezone(ZoneInfo("US/Pacific"))
-            .strftime("%H:%M:%S %m-%d-%Y"),
-            labels=labels,
             miller_location=miller_location,
-            min_monies=min_monies,
-            max_monies=max_monies,
-            q1_monies=q1_monies,
-            median_monies=median_monies,
-            q3_monies=q3_monies,
             stock_cnt=stock_cnt,
-            sp500_prices=sp500_prices,  # Add S&P 500 prices
-            low_monies=min_monies,
-            high_monies=max_monies,
-            zip=zip,
+            chart_data=chart_data,
         )
-        # print("all done with the index page")
-        return rendered
 
 
-def make_user_page(player_name):
+def make_user_page(player_name, db=None):
+    """Render one player's page from indexed queries, without loading the whole history
+
+    Also writes the chart data the page fetches, see write_chart_series.
+    """
     with app.app_context():
-        leaderboard_files = sorted(glob("./backend/leaderboards/in_time/*"))
+        if db is None:
+            db = HistoryDB()
+            db.sync()
         labels = []
-        player_money = []
-        sp500_prices = []
         timestamps = []
+        snapshot_times = db.snapshot_times()
 
         # First collect all timestamps
-        for file in leaderboard_files:
-            file_name = os.path.basename(file)
-            date_time_str = file_name[len("leaderboard-") : -len(".json")]
-            date_time = datetime.strptime(
-                date_time_str.replace("_", ":"), "%Y-%m-%d-%H:%M"
-            ).replace(tzinfo=ZoneInfo("America/Los_Angeles"))  # Add timezone info
-            timestamps.append(date_time)
-
-        # Fetch S&P 500 data
-        if timestamps:
-            start_date = min(timestamps)
-            end_date = max(timestamps)
-            # Add timezone info to yfinance download
-            sp500 = yf.download(
-                "SPY",
-                start=start_date.astimezone(ZoneInfo("America/New_York")),
-                end=end_date.astimezone(ZoneInfo("America/New_York")),
-                interval="5m",
-            )
-            # Convert SP500 index to Pacific time
-            sp500.index = sp500.index.tz_convert("America/Los_Angeles")
-
-            # Get initial S&P 500 price, looking at exact timestamps
-            initial_sp500_price = None
-            for timestamp in sorted(sp500.index):
-                if timestamp >= start_date:
-                    initial_sp500_price = float(sp500.loc[timestamp, "Close"])
-                    break
-
-            if initial_sp500_price is None:
-                initial_sp500_price = float(sp500["Close"].iloc[0])
-
-        # Process each file
-        for file, timestamp in zip(leaderboard_files, timestamps):
-            with open(file, "r") as file:
-                dict_leaderboard = json.load(file)
+        for date_time in snapshot_times:
+            timestamps.append(
+                date_time.replace(tzinfo=ZoneInfo("America/Los_Angeles"))
+            )  # Add timezone info
 
+        # Process each snapshot
+        for timestamp in timestamps:
             # Format timestamp with full UTC date-time info
             date_time_str = timestamp.strftime("%Y-%m-%dT%H:%M:%S")
             labels.append(date_time_str)
 
-            # Get S&P 500 price
-            try:
-                # Find closest timestamp
-                closest_idx = sp500.index.get_indexer([timestamp], method="nearest")[0]
-                closest_time = sp500.index[closest_idx]
-                current_sp500_price = float(sp500.loc[closest_time, "Close"])
-                relative_return = current_sp500_price / initial_sp500_price
-                sp500_price = 100000 * relative_return
-            except (KeyError, IndexError):
-                sp500_price = None
-            sp500_prices.append(sp500_price)
-
-            # Process player data
-            df = pd.DataFrame.from_dict(dict_leaderboard, orient="index")
-            df.reset_index(level=0, inplace=True)
-            if (
-                len(df.columns) == 3
-            ):  # IF the file has only 3 columns, then add a new column to the dataframe as a place holder
-                df["Stocks Invested In"] = [0 for i in range(len(df))]
-            df.columns = [
-                "Account Name",
-                "Money In Account",
-                "Investopedia Link",
-                "Stocks Invested In",
-            ]
+        # The S&P 500 at each snapshot (benchmark.py)
+        sp500_prices = sp500_values(snapshot_times)
 
-            df = df.sort_values(by=["Money In Account"], ascending=False)
-            df["Ranking"] = range(1, 1 + len(df))
-            if player_name in df["Account Name"].values:
-                player_money.append(
-                    float(
-                        df.loc[
-                            df["Account Name"] == player_name, "Money In Account"
-                        ].values[0]
-                    )
-                )
-        investopedia_link = df.loc[
-            df["Account Name"] == player_name, "Investopedia Link"
-        ].values[0]
-        player_stocks = []
-        player_stocks_data = df.loc[
-            df["Account Name"] == player_name, "Stocks Invested In"
-        ].iloc[0]
-        for stock in player_stocks_data:
-            player_stocks.append(
-                [
-                    stock[0],  # ticker
-                    float(
-                        stock[1].replace("$", "").replace(",", "")
-                    ),  # invested amount
-                    float(stock[2].replace("%", "")),  # percentage change
-                ]
+        # Process player data, lined up with the labels and null where the
+        # player wasn't in the snapshot. Snapshots from before a mid-season
+        # player joined have their starting value but no rank
+        player_history = {
+            time: (value, rank)
+            for time, value, rank in db.player_history(
+                player_name, roster=load_roster()
             )
+        }
+        missing = (None, None)
+        player_money = [player_history.get(t, missing)[0] for t in snapshot_times]
+        player_ranks = [player_history.get(t, missing)[1] for t in snapshot_times]
+        investopedia_link = db.player_url(player_name)
+        # Holdings are stored as [ticker, invested amount, percentage change]
+        player_stocks = db.player_holdings(player_name)
+
+        if snapshot_times:
+            updated = snapshot_update_time(snapshot_times[-1])
+        else:
+            updated = update_time()
+        series = write_chart_series(labels, sp500_prices, updated)
+        cache = RenderCache()
+        write_player_data(cache, player_name, series, player_money, player_ranks)
+        cache.save()
 
         rendered = render_template(
             "player.html",
-            labels=labels,
-            player_money=player_money,
             player_name=player_name,
             investopedia_link=investopedia_link,
             player_stocks=player_stocks,
-            update_time=datetime.utcnow()
-            .astimezone(ZoneInfo("US/Pacific"))
-            .strftime("%H:%M:%S %m-%d-%Y"),
-            sp500_prices=sp500_prices,
+            update_time=update_time(),
             zip=zip,
         )
         return rendered
 
 
-def make_user_pages(usernames):
-    """Generate HTML pages for multiple users at once"""
+def make_user_pages(usernames, history=None, cache=None):
+    """Generate HTML pages for multiple users at once
+
+    Only the pages whose inputs changed since the last run are written, see
+    render_cache.py.
+    """
     with app.app_context():
-        leaderboard_files = sorted(glob("./backend/leaderboards/in_time/*"))
+        save = cache is None
+        if save:
+            cache = RenderCache()
+        if history is None:
+            history = shared_history()
+        history = history.in_session()
+        # Ranks only count the players actually in each snapshot, the
+        # starting value before a mid-season player joined is just charted
+        ranks = history.ranks()
+        history = history.with_baseline(load_roster())
         labels = []
-        all_dfs = []
         timestamps = []
-        sp500_prices = []
-
-        # Collect timestamps and process files
-        for file in leaderboard_files:
-            file_name = os.path.basename(file)
-            date_time_str = file_name[len("leaderboard-") : -len(".json")]
-            date_time = datetime.strptime(
-                date_time_str.replace("_", ":"), "%Y-%m-%d-%H:%M"
-            )
-            timestamps.append(date_time)
-
-        # Fetch S&P 500 data
-        start_date = min(timestamps).date()
-        end_date = max(timestamps).date() + timedelta(days=1)
-        sp500 = yf.download("SPY", start=start_date, end=end_date, interval="5m")
-
-        # Get initial S&P 500 price
-        initial_sp500_price = None
-        initial_date = start_date
-        while initial_sp500_price is None and initial_date <= end_date:
-            try:
-                initial_sp500_price = float(sp500.loc[initial_date, "Close"])
-            except KeyError:
-                initial_date += timedelta(days=1)
 
-        if initial_sp500_price is None:
-            initial_sp500_price = float(sp500["Close"].iloc[0])
+        # Collect timestamps
+        timestamps.extend(history.times)
 
         # Process each timestamp
-        for file, timestamp in zip(leaderboard_files, timestamps):
+        for timestamp in timestamps:
             # Format timestamp with full UTC date-time info
             date_time_str = timestamp.strftime("%Y-%m-%dT%H:%M:%S")
             labels.append(date_time_str)
 
-            # Get S&P 500 price
-            date_for_sp500 = timestamp.date()
-            try:
-                current_sp500_price = float(sp500.loc[date_for_sp500, "Close"])
-                relative_return = current_sp500_price / initial_sp500_price
-                sp500_price = 100000 * relative_return
-            except KeyError:
-                previous_dates = sp500.index[sp500.index.date <= date_for_sp500]
-                if len(previous_dates) > 0:
-                    current_sp500_price = float(
-                        sp500.loc[previous_dates[-1], "Close"].iloc[0]
-                    )
-                    relative_return = current_sp500_price / initial_sp500_price
-                    sp500_price = 100000 * relative_return
-                else:
-                    sp500_price = None
-            sp500_prices.append(sp500_price)
-
-            # Process leaderboard data
-            with open(file, "r") as f:
-                dict_leaderboard = json.load(f)
-            # ...existing DataFrame processing code...
-            df = pd.DataFrame.from_dict(dict_leaderboard, orient="index")
-            df.reset_index(level=0, inplace=True)
-            if len(df.columns) == 3:
-                df["Stocks Invested In"] = [0 for i in range(len(df))]
-            df.columns = [
-                "Account Name",
-                "Money In Account",
-                "Investopedia Link",
-                "Stocks Invested In",
-            ]
-            df = df.sort_values(by=["Money In Account"], ascending=False)
-            df["Ranking"] = range(1, 1 + len(df))
-            all_dfs.append(df)
+        # The S&P 500 at each snapshot (benchmark.py)
+        sp500_prices = sp500_values(history.times)
 
-        # Get latest df for stock information
-        latest_df = all_dfs[-1]
+        latest_holdings = history.holdings_at(len(history) - 1)
+        series = write_chart_series(
+            labels, sp500_prices, snapshot_update_time(history.times[-1])
+        )
+        rendered_at = update_time()
 
         # Process each user using the pre-processed data
         for player_name in usernames:
-            player_money = []
-            rankings = []
-
             # Check if player exists in latest data
-            if player_name not in latest_df["Account Name"].values:
+            player_column = history.index.get(player_name)
+            if player_column is None or np.isnan(history.values[-1, player_column]):
                 continue
 
-            # Extract data for this player from all timepoints
-            for df in all_dfs:
-                if player_name in df["Account Name"].values:
-                    rankings.append(
-                        float(
-                            df.loc[df["Account Name"] == player_name, "Ranking"].values[
-                                0
-                            ]
-                        )
-                    )
-                    player_money.append(
-                        float(
-                            df.loc[
-                                df["Account Name"] == player_name, "Money In Account"
-                            ].values[0]
-                        )
-                    )
+            # The player's column across every snapshot, lined up with the
+            # labels, null where they weren't in the snapshot
+            player_money = json_column(history.values[:, player_column])
+            player_ranks = json_column(ranks[:, player_column], int)
 
             # Get player details from latest data
-            investopedia_link = latest_df.loc[
-                latest_df["Account Name"] == player_name, "Investopedia Link"
-            ].values[0]
-            player_stocks_data = latest_df.loc[
-                latest_df["Account Name"] == player_name, "Stocks Invested In"
-            ].iloc[0]
-
-            # Process stock data
-            player_stocks = [
-                [
-                    stock[0],
-                    float(stock[1].replace("$", "").replace(",", "")),
-                    float(stock[2].replace("%", "")),
-                ]
-                for stock in player_stocks_data
-            ]
+            investopedia_link = history.urls[player_column]
+            player_stocks = latest_holdings.get(player_name, [])
 
-            # Render template
-            rendered = render_template(
-                "player.html",
-                labels=labels,
-                player_money=player_money,
+            write_player_data(cache, player_name, series, player_money, player_ranks)
+
+            # The page itself only changes with the player's holdings
+            page = f"players/{player_name}.html"
+            context = dict(
                 player_name=player_name,
                 investopedia_link=investopedia_link,
                 player_stocks=player_stocks,
-                update_time=datetime.utcnow()
-                .astimezone(ZoneInfo("US/Pacific"))
-                .strftime("%H:%M:%S %m-%d-%Y"),
-                sp500_prices=sp500_prices,
-                zip=zip,
             )
+            cache.render(page, "player.html", context, update_time=rendered_at, zip=zip)
+
+        remove_stale_series()
 
-            with open(f"players/{player_name}.html", "w") as f:
-                f.write(rendered)
+        if save:
+            cache.save()
 
 
 if __name__ == "__main__":
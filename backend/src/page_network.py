@@ -0,0 +1,162 @@
+import asyncio
+import os
+from urllib.parse import urlparse
+
+from holding import Holding
+
+# Only the DOM text and the simulator's own API calls matter to the scraper,
+# everything else on the portfolio pages is wasted bandwidth
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font", "texttrack", "manifest"}
+
+# Hosts that are allowed through, anything else is treated as third party
+FIRST_PARTY_HOSTS = [
+    "investopedia.com",
+    urlparse(
+        os.environ.get("INVESTOPEDIA_BASE_URL", "https://www.investopedia.com")
+    ).hostname,
+] + [
+    host.strip()
+    for host in os.environ.get("SCRAPER_ALLOWED_HOSTS", "").split(",")
+    if host.strip()
+]
+
+# Keys the simulator's JSON payloads use for the fields we read off the page
+ACCOUNT_VALUE_KEYS = ("accountValue", "account_value")
+PORTFOLIO_NAME_KEYS = ("portfolioName", "userPortfolioName")
+HOLDINGS_KEYS = ("holdings", "stockHoldings", "positions")
+HOLDING_SYMBOL_KEYS = ("symbol", "ticker")
+HOLDING_VALUE_KEYS = ("marketValue", "totalValue", "value")
+HOLDING_GAIN_PCT_KEYS = ("totalGainPercent", "gainLossPercent", "percentGain")
+
+
+def is_first_party(url):
+    host = urlparse(url).hostname or ""
+    return any(
+        host == allowed or host.endswith("." + allowed) for allowed in FIRST_PARTY_HOSTS
+    )
+
+
+async def block_non_essential(route):
+    """Route handler that drops images, fonts, media and third party requests"""
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or not is_first_party(
+        request.url
+    ):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def enable_resource_blocking(context):
+    await context.route("**/*", block_non_essential)
+
+
+def _first_key(data, keys):
+    for key in keys:
+        if key in data and data[key] is not None:
+            return data[key]
+    return None
+
+
+def _to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).replace("$", "").replace(",", "").replace("%", ""))
+
+
+def _parse_holding(item):
+    symbol = _first_key(item, HOLDING_SYMBOL_KEYS)
+    value = _first_key(item, HOLDING_VALUE_KEYS)
+    gain = _first_key(item, HOLDING_GAIN_PCT_KEYS)
+    if symbol is None or value is None or gain is None:
+        return None
+    try:
+        return Holding(str(symbol).strip(), _to_float(value), _to_float(gain))
+    except ValueError:
+        return None  # "N/A" and the like
+
+
+def _read_portfolio(node):
+    """(account_name, account_value, stock_data) if `node` carries all three"""
+    value = _first_key(node, ACCOUNT_VALUE_KEYS)
+    name = _first_key(node, PORTFOLIO_NAME_KEYS)
+    holdings = _first_key(node, HOLDINGS_KEYS)
+    if not isinstance(value, (int, float, str)):
+        return None
+    if not isinstance(name, str) or not name.strip():
+        return None
+    if not isinstance(holdings, list):
+        return None
+    try:
+        value = _to_float(value)
+    except ValueError:
+        return None
+    rows = [_parse_holding(item) for item in holdings if isinstance(item, dict)]
+    if any(row is None for row in rows):
+        return None
+    return name.replace(" Portfolio", "").strip(), value, rows
+
+
+def find_portfolio(payload):
+    """Walk a JSON payload looking for the account value, name and holdings
+
+    All three have to come from the same object, so a payload that also
+    carries the logged in account's own profile can't mix the two up.
+    Returns (account_name, account_value, stock_data) or None if no object
+    carries all three.
+    """
+    if isinstance(payload, dict):
+        portfolio = _read_portfolio(payload)
+        if portfolio is not None:
+            return portfolio
+        children = payload.values()
+    elif isinstance(payload, list):
+        children = payload
+    else:
+        return None
+    for child in children:
+        portfolio = find_portfolio(child)
+        if portfolio is not None:
+            return portfolio
+    return None
+
+
+class JsonCapture:
+    """Collects the JSON bodies of a page's XHR/fetch responses as they arrive"""
+
+    def __init__(self, page):
+        self.responses = []
+        self.portfolio = None
+        self.found = asyncio.Event()
+        page.on("response", self._on_response)
+
+    async def _on_response(self, response):
+        if response.request.resource_type not in ("xhr", "fetch"):
+            return
+        if "json" not in response.headers.get("content-type", ""):
+            return
+        try:
+            payload = await response.json()
+        except Exception:
+            return
+        self.responses.append((response.url, payload))
+        if self.portfolio is None:
+            self.portfolio = find_portfolio(payload)
+            if self.portfolio is not None:
+                self.found.set()
+
+    async def wait_for_portfolio(self, fallback):
+        """Wait for a payload with the portfolio in it or for `fallback`, whichever is first
+
+        `fallback` is an awaitable, the DOM wait the page is read with if
+        its payloads don't carry the portfolio. Returns the portfolio, None
+        if `fallback` finished first. Whatever `fallback` raised is left to
+        the DOM path to run into again.
+        """
+        found = asyncio.ensure_future(self.found.wait())
+        fallback = asyncio.ensure_future(fallback)
+        await asyncio.wait({found, fallback}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (found, fallback):
+            task.cancel()
+        await asyncio.gather(found, fallback, return_exceptions=True)
+        return self.portfolio
@@ -0,0 +1,149 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from holding import cost_basis, parse_holdings, resized
+from snapshot_archive import list_snapshots, load_snapshots, snapshot_time
+
+REFRESH_STATE_PATH = "./backend/refresh_state.json"
+LATEST_LEADERBOARD_PATH = "./backend/leaderboards/leaderboard-latest.json"
+
+# Accounts that traded this recently, or sit this high on the leaderboard, are
+# scraped every cycle; everybody else at most every DORMANT_INTERVAL
+ACTIVE_WINDOW = timedelta(days=float(os.environ.get("REFRESH_ACTIVE_DAYS", "2")))
+TOP_RANKED = int(os.environ.get("REFRESH_TOP_RANKED", "20"))
+DORMANT_INTERVAL = timedelta(
+    minutes=float(os.environ.get("REFRESH_DORMANT_MINUTES", "20"))
+)
+# No carried forward value may get older than this, past it everyone is scraped
+MAX_STALENESS = timedelta(
+    minutes=float(os.environ.get("REFRESH_MAX_STALE_MINUTES", "60"))
+)
+
+
+def holdings_signature(stocks):
+    """Map each symbol to its cost basis, which only changes when the player trades
+
+    Position values and gains move with the market every snapshot, but
+    value / (1 + gain) stays put until shares are bought or sold.
+    """
+    return {
+        holding.symbol: cost_basis(holding.amount, holding.gain)
+        for holding in parse_holdings(stocks)
+        if holding.amount is not None and holding.gain is not None
+    }
+
+
+def traded(previous, current):
+    if previous.keys() != current.keys():
+        return True
+    return any(resized(previous[symbol], basis) for symbol, basis in current.items())
+
+
+class RefreshScheduler:
+    """Decides which accounts need a fresh scrape this cycle
+
+    Per account it remembers when it was last scraped, the cost basis of each
+    holding, and when that last changed (i.e. when the player last traded).
+    The trade history is built from the in_time snapshots the first time and
+    then kept up to date from new snapshots and fresh scrapes.
+    """
+
+    def __init__(self, path=REFRESH_STATE_PATH):
+        self.path = path
+        self.state = {
+            "processed_until": None,
+            "last_full_refresh": None,
+            "accounts": {},
+        }
+        self.full_refresh = False
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self.state = json.load(file)
+
+    def _account(self, url):
+        return self.state["accounts"].setdefault(
+            url, {"last_refresh": None, "last_trade": None, "signature": None}
+        )
+
+    def observe(self, url, stocks, when):
+        """Record the holdings an account had at `when`"""
+        account = self._account(url)
+        signature = holdings_signature(stocks)
+        if account["signature"] is None or traded(account["signature"], signature):
+            account["last_trade"] = when.isoformat()
+        account["signature"] = signature
+
+    def catch_up(self):
+        """Read in_time snapshots written since the last time we looked"""
+        processed_until = self.state["processed_until"]
+        if processed_until is None:
+            snapshots = list_snapshots(("in_time",))
+        else:
+            snapshots = [
+                snapshot
+                for snapshot in list_snapshots(
+                    ("in_time",), start=snapshot_time(processed_until)
+                )
+                if snapshot.name > processed_until
+            ]
+        for snapshot, data in load_snapshots(snapshots):
+            when = snapshot_time(snapshot.name)
+            for account_data in data.values():
+                if len(account_data) > 2:
+                    self.observe(account_data[1].strip(), account_data[2], when)
+            self.state["processed_until"] = snapshot.name
+
+    def top_ranked_urls(self):
+        if not os.path.exists(LATEST_LEADERBOARD_PATH):
+            return set()
+        with open(LATEST_LEADERBOARD_PATH, "r") as file:
+            latest = json.load(file)
+        ranked = sorted(latest.values(), key=lambda data: data[0], reverse=True)
+        return {data[1].strip() for data in ranked[:TOP_RANKED]}
+
+    def select(self, urls, now):
+        """Return the subset of urls that should be scraped at `now`"""
+        self.catch_up()
+        # Hard bound: the first cycle of the day, and every MAX_STALENESS after
+        # that, scrapes everyone so no carried forward value gets too old
+        last_full = self.state["last_full_refresh"]
+        self.full_refresh = (
+            last_full is None
+            or datetime.fromisoformat(last_full).date() != now.date()
+            or now - datetime.fromisoformat(last_full) >= MAX_STALENESS
+        )
+        if self.full_refresh:
+            return list(urls)
+
+        top_ranked = self.top_ranked_urls()
+        selected = []
+        for url in urls:
+            account = self._account(url)
+            last_trade = account["last_trade"]
+            last_refresh = account["last_refresh"]
+            active = last_trade is None or (
+                now - datetime.fromisoformat(last_trade) <= ACTIVE_WINDOW
+            )
+            due = last_refresh is None or (
+                now - datetime.fromisoformat(last_refresh) >= DORMANT_INTERVAL
+            )
+            if active or url in top_ranked or due:
+                selected.append(url)
+        print(f"Tiered refresh: scraping {len(selected)} of {len(urls)} accounts")
+        return selected
+
+    def refreshed(self, account_information, urls, now):
+        """Mark freshly scraped accounts and learn from their holdings"""
+        urls = set(urls)
+        for account_data in account_information.values():
+            url = account_data[1].strip()
+            if url in urls:
+                self.observe(url, account_data[2], now)
+                self._account(url)["last_refresh"] = now.isoformat()
+        if self.full_refresh:
+            self.state["last_full_refresh"] = now.isoformat()
+
+    def save(self):
+        with open(self.path, "w") as file:
+            json.dump(self.state, file)
@@ -0,0 +1,95 @@
+"""Skip re-rendering pages whose inputs haven't changed
+
+Every cycle used to re-render and rewrite index.html and every player page,
+even outside market hours when nothing had been scraped. RenderCache keeps a
+hash of each page's template and inputs in backend/render_hashes.json and
+only renders and writes the pages whose hash changed, which also keeps the
+`pixi run git_push` diff down to the pages that actually moved.
+
+The "last updated" time isn't part of the hash, so an unchanged page keeps
+the time it was last rendered at. Set FORCE_RENDER=True to render everything.
+"""
+
+import hashlib
+import json
+import os
+
+from flask import render_template
+
+RENDER_HASHES_PATH = "./backend/render_hashes.json"
+TEMPLATES_DIR = "./templates"
+FORCE_RENDER = os.environ.get("FORCE_RENDER") == "True"
+
+
+class RenderCache:
+    def __init__(self, path=RENDER_HASHES_PATH):
+        self.path = path
+        self.hashes = {}
+        if os.path.exists(path) and not FORCE_RENDER:
+            with open(path, "r") as file:
+                self.hashes = json.load(file)
+        self._templates = {}
+        self.rendered = 0
+        self.skipped = 0
+
+    def _template_hash(self, template):
+        # Pages extend base.html, a change to it re-renders everything
+        if template not in self._templates:
+            digest = hashlib.sha256()
+            for name in ("base.html", template):
+                with open(os.path.join(TEMPLATES_DIR, name), "rb") as file:
+                    digest.update(file.read())
+            self._templates[template] = digest.hexdigest()
+        return self._templates[template]
+
+    def digest(self, template, context):
+        inputs = json.dumps(
+            [self._template_hash(template), context], sort_keys=True, default=str
+        )
+        return hashlib.sha256(inputs.encode()).hexdigest()
+
+    def changed(self, page, template, context):
+        """The new hash of `page` if its inputs changed, None if they didn't"""
+        digest = self.digest(template, context)
+        if self.hashes.get(page) == digest and os.path.exists(page):
+            self.skipped += 1
+            return None
+        return digest
+
+    def record(self, page, digest):
+        """Remember `page` was written from inputs hashing to `digest`"""
+        self.hashes[page] = digest
+        self.rendered += 1
+
+    def render(self, page, template, context, **volatile):
+        """Render `template` into the file `page` if its inputs changed
+
+        `context` is hashed, `volatile` (the update time, helpers like zip)
+        is passed to the template without being. Needs an app context.
+        Returns whether the page was written.
+        """
+        digest = self.changed(page, template, context)
+        if digest is None:
+            return False
+        rendered = render_template(template, **context, **volatile)
+        with open(page, "w") as file:
+            file.write(rendered)
+        self.record(page, digest)
+        return True
+
+    def write_json(self, path, data):
+        """Write `data` to the JSON file `path` if it changed"""
+        content = json.dumps(data, separators=(",", ":"))
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        if self.hashes.get(path) == digest and os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(content)
+        self.hashes[path] = digest
+        return True
+
+    def save(self):
+        print(f"Rendered {self.rendered} pages, {self.skipped} unchanged")
+        with open(self.path, "w") as file:
+            json.dump(self.hashes, file, indent=0, sort_keys=True)
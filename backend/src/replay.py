@@ -0,0 +1,220 @@
+"""Record Investopedia pages and replay them from a local stand-in server
+
+Recording: run main.py with SCRAPER_RECORD=True and every page the scraper
+reads (the login flow and each portfolio) is saved under
+backend/replay/recordings, scripts stripped so the snapshot renders as is.
+
+Replaying: run `python ./backend/src/replay.py` and point the scraper at it
+with INVESTOPEDIA_BASE_URL=http://127.0.0.1:8765. Latency and failures can be
+injected to benchmark concurrency settings reproducibly offline.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RECORDINGS_DIR = "./backend/replay/recordings"
+# The login form is recorded under its own name, since the simulator serves
+# it and the logged in home page at the same url. The stand-in serves it for
+# /simulator/home.aspx until the form is posted, which sets SESSION_COOKIE
+LOGIN_FORM_URL = "/simulator/login-form"
+SESSION_COOKIE = "replay_session"
+
+SCRIPT_TAG = re.compile(r"<script\b[^>]*>.*?</script>", re.IGNORECASE | re.DOTALL)
+PORTFOLIO_NAME = re.compile(
+    r'(data-cy="user-portfolio-name"[^>]*>)([^<]*)(<)', re.IGNORECASE
+)
+
+
+def recording_name(url):
+    """File name (without extension) a url's recording is stored under"""
+    parsed = urlparse(url)
+    name = parsed.path.strip("/").replace("/", "_") or "index"
+    if parsed.query:
+        name += "__" + re.sub(r"[^A-Za-z0-9=._-]", "_", parsed.query)
+    return name
+
+
+async def record_page(page, url, responses=None, directory=RECORDINGS_DIR):
+    """Save the rendered page (and any JSON responses it fetched) for replay"""
+    os.makedirs(directory, exist_ok=True)
+    name = recording_name(url)
+    html = SCRIPT_TAG.sub("", await page.content())
+    with open(os.path.join(directory, f"{name}.html"), "w") as file:
+        file.write(html)
+    if responses:
+        with open(os.path.join(directory, f"{name}.responses.json"), "w") as file:
+            json.dump(
+                [{"url": url, "body": body} for url, body in responses], file, indent=1
+            )
+
+
+class Recordings:
+    """Recorded pages and JSON responses, looked up by request path and query"""
+
+    def __init__(self, directory=RECORDINGS_DIR):
+        self.pages = {}
+        self.json = {}
+        for file_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file_name)
+            if file_name.endswith(".responses.json"):
+                with open(path, "r") as file:
+                    for response in json.load(file):
+                        key = recording_name(response["url"])
+                        self.json.setdefault(key, []).append(response["body"])
+            elif file_name.endswith(".html"):
+                with open(path, "r") as file:
+                    self.pages[file_name[: -len(".html")]] = file.read()
+        self.portfolios = sorted(
+            name for name in self.pages if "user-portfolio" in name
+        )
+
+    def page(self, url, synthesize=False):
+        name = recording_name(url)
+        if name in self.pages:
+            return self.pages[name]
+        if synthesize and "user-portfolio" in name and self.portfolios:
+            return self.synthesized_portfolio(url)
+        return None
+
+    def synthesized_portfolio(self, url):
+        """Serve an unrecorded portfolio as a copy of a recorded one, renamed
+
+        Lets a handful of recordings stand in for a roster of any size.
+        """
+        portfolio_id = parse_qs(urlparse(url).query).get("portfolio", [url])[0]
+        digest = int(hashlib.sha1(portfolio_id.encode()).hexdigest(), 16)
+        html = self.pages[self.portfolios[digest % len(self.portfolios)]]
+        return PORTFOLIO_NAME.sub(
+            lambda match: (
+                f"{match.group(1)}replay{portfolio_id} Portfolio{match.group(3)}"
+            ),
+            html,
+            count=1,
+        )
+
+
+def make_handler(recordings, latency, jitter, failure_rate, hang_rate, synthesize):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def _respond(self):
+            time.sleep(max(0.0, random.gauss(latency, jitter)))
+            roll = random.random()
+            if roll < failure_rate:
+                self.send_error(503, "Injected failure")
+                return
+            if roll < failure_rate + hang_rate:
+                # Simulate a page that never finishes loading
+                time.sleep(600)
+                return
+
+            name = recording_name(self.path)
+            logged_in = f"{SESSION_COOKIE}=" in self.headers.get("Cookie", "")
+            cookie = None
+            if name in recordings.json:
+                bodies = recordings.json[name]
+                body = json.dumps(random.choice(bodies)).encode()
+                content_type = "application/json"
+            else:
+                # The login form posts back to the simulator, answer with the
+                # logged in home page so the replayed login succeeds
+                if self.command == "POST":
+                    page = recordings.page("/simulator/home.aspx")
+                    cookie = f"{SESSION_COOKIE}=1; Path=/"
+                elif (
+                    name == recording_name("/simulator/home.aspx")
+                    and not logged_in
+                    and recordings.page(LOGIN_FORM_URL) is not None
+                ):
+                    page = recordings.page(LOGIN_FORM_URL)
+                else:
+                    page = recordings.page(self.path, synthesize)
+                if page is None:
+                    self.send_error(404, "Not recorded")
+                    return
+                body = page.encode()
+                content_type = "text/html; charset=utf-8"
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if cookie is not None:
+                self.send_header("Set-Cookie", cookie)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            self.rfile.read(length)
+            self._respond()
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def serve(
+    host="127.0.0.1",
+    port=8765,
+    directory=RECORDINGS_DIR,
+    latency=0.0,
+    jitter=0.0,
+    failure_rate=0.0,
+    hang_rate=0.0,
+    synthesize=False,
+):
+    recordings = Recordings(directory)
+    handler = make_handler(
+        recordings, latency, jitter, failure_rate, hang_rate, synthesize
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    print(
+        f"Replaying {len(recordings.pages)} pages and {len(recordings.json)} JSON "
+        f"endpoints on http://{host}:{port}"
+    )
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--recordings", default=RECORDINGS_DIR)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="mean seconds added per request"
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency std dev")
+    parser.add_argument(
+        "--failure-rate", type=float, default=0.0, help="share of requests given a 503"
+    )
+    parser.add_argument(
+        "--hang-rate",
+        type=float,
+        default=0.0,
+        help="share of requests that never finish",
+    )
+    parser.add_argument(
+        "--synthesize",
+        action="store_true",
+        help="serve unrecorded portfolios as renamed copies of recorded ones",
+    )
+    args = parser.parse_args()
+    serve(
+        args.host,
+        args.port,
+        args.recordings,
+        args.latency,
+        args.jitter,
+        args.failure_rate,
+        args.hang_rate,
+        args.synthesize,
+    )
@@ -0,0 +1,111 @@
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+FAILED_ACCOUNTS_PATH = "./backend/failed_accounts.json"
+LATEST_LEADERBOARD_PATH = "./backend/leaderboards/leaderboard-latest.json"
+
+
+class RetryPolicy:
+    """Bounded retries with exponential backoff and jitter, plus a per-run failure budget
+
+    Once more than `run_failure_budget` accounts have given up in one run the
+    run's breaker trips and every remaining account only gets a single attempt,
+    so a bad run (site down, logged out everywhere) still finishes on time.
+    """
+
+    def __init__(
+        self, max_attempts=3, base_delay=2.0, max_delay=60.0, run_failure_budget=10
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.run_failure_budget = run_failure_budget
+        self.run_failures = 0
+
+    @property
+    def run_tripped(self):
+        return self.run_failures >= self.run_failure_budget
+
+    def attempts_allowed(self):
+        return 1 if self.run_tripped else self.max_attempts
+
+    def delay(self, attempt):
+        """Seconds to wait before retry number `attempt` (1 = first retry)"""
+        cap = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def gave_up(self):
+        self.run_failures += 1
+        if self.run_failures == self.run_failure_budget:
+            print(
+                f"{self.run_failures} accounts failed this run, "
+                "no more retries for the rest of the run"
+            )
+
+
+class FailedAccounts:
+    """Remembers which portfolio urls keep failing across runs
+
+    A url that gives up `threshold` runs in a row is skipped for `cooldown`
+    (doubling every extra failed run, up to `max_cooldown`) and then tried
+    again; a single success resets it.
+    """
+
+    def __init__(
+        self,
+        path=FAILED_ACCOUNTS_PATH,
+        threshold=3,
+        cooldown=timedelta(minutes=30),
+        max_cooldown=timedelta(hours=12),
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.accounts = {}
+        if os.path.exists(path):
+            with open(path, "r") as file:
+                self.accounts = json.load(file)
+
+    def should_skip(self, url, now=None):
+        state = self.accounts.get(url)
+        if not state or not state.get("skip_until"):
+            return False
+        now = now or datetime.now()
+        return now < datetime.fromisoformat(state["skip_until"])
+
+    def update(self, succeeded_urls, failed_urls, now=None):
+        now = now or datetime.now()
+        for url in succeeded_urls:
+            self.accounts.pop(url, None)
+        for url in failed_urls:
+            state = self.accounts.setdefault(url, {"consecutive_failures": 0})
+            state["consecutive_failures"] += 1
+            state["last_failure"] = now.isoformat()
+            extra_failures = state["consecutive_failures"] - self.threshold
+            if extra_failures >= 0:
+                skip_for = min(self.max_cooldown, self.cooldown * 2**extra_failures)
+                state["skip_until"] = (now + skip_for).isoformat()
+
+    def save(self):
+        with open(self.path, "w") as file:
+            json.dump(self.accounts, file, indent=2)
+
+
+def carry_forward(account_information, missing_urls):
+    """Fill in accounts that gave up this run with their last known leaderboard entry"""
+    if not missing_urls or not os.path.exists(LATEST_LEADERBOARD_PATH):
+        return account_information
+    with open(LATEST_LEADERBOARD_PATH, "r") as file:
+        latest = json.load(file)
+
+    missing_urls = set(missing_urls)
+    for account_name, account_data in latest.items():
+        if account_data[1].strip() in missing_urls and account_name not in (
+            account_information
+        ):
+            print(f"Carrying forward last known value for {account_name}")
+            account_information[account_name] = account_data
+    return account_information
@@ -0,0 +1,46 @@
+"""Players who joined after the game started, and what they started with
+
+Adding a player used to backfill them at $100,000 into every in_time
+snapshot, rewriting the whole history (and racing the scraper). Now
+add_user.py only appends a `name,url,joined,starting_value` row to
+backend/portfolios/roster.csv and the snapshots are left alone: whoever
+reads the history fills in the starting value for the snapshots taken
+before the player joined, see History.with_baseline.
+
+Players without a roster row were there from the start and get no baseline.
+"""
+
+import csv
+import os
+from collections import namedtuple
+from datetime import datetime
+
+ROSTER_PATH = "./backend/portfolios/roster.csv"
+TIME_FORMAT = "%Y-%m-%d-%H_%M"  # New York wall clock, like the snapshot names
+DEFAULT_STARTING_VALUE = 100000.00
+
+RosterEntry = namedtuple("RosterEntry", ["name", "url", "joined", "starting_value"])
+
+
+def load_roster(path=ROSTER_PATH):
+    """{name: RosterEntry} for every player who joined mid-season"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", newline="") as file:
+        return {
+            name: RosterEntry(
+                name,
+                url,
+                datetime.strptime(joined, TIME_FORMAT),
+                float(starting_value),
+            )
+            for name, url, joined, starting_value in csv.reader(file)
+        }
+
+
+def join(name, url, joined, starting_value=DEFAULT_STARTING_VALUE, path=ROSTER_PATH):
+    """Record that `name` joined at `joined` (naive New York time)"""
+    with open(path, "a", newline="") as file:
+        csv.writer(file).writerow(
+            [name, url, joined.strftime(TIME_FORMAT), starting_value]
+        )
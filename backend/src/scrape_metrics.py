@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+LOG_DIR = "logs"
+ACCOUNT_METRICS_PATH = os.path.join(LOG_DIR, "scrape-accounts.jsonl")
+RUN_METRICS_PATH = os.path.join(LOG_DIR, "scrape-runs.jsonl")
+
+PHASES = ("login", "navigation", "selector_wait", "table_parse")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, None for an empty list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "max": max(values) if values else None,
+    }
+
+
+class AttemptTimer:
+    """Times the phases of one attempt at scraping one account"""
+
+    def __init__(self, url, attempt):
+        self.url = url
+        self.attempt = attempt
+        self.phases = {}
+        self.start = time.monotonic()
+        self.source = "dom"
+        self.error = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    def record(self, ok):
+        return {
+            "url": self.url,
+            "attempt": self.attempt,
+            "ok": ok,
+            "source": self.source,
+            "total": round(time.monotonic() - self.start, 3),
+            "phases": {name: round(value, 3) for name, value in self.phases.items()},
+            "error": self.error,
+        }
+
+
+class ScrapeMetrics:
+    """Collects per-attempt records for one scrape run and writes them as JSON lines
+
+    Every attempt becomes one line in logs/scrape-accounts.jsonl and the run
+    gets one summary line in logs/scrape-runs.jsonl.
+    """
+
+    def __init__(self):
+        self.run_id = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        self.start = time.monotonic()
+        self.records = []
+        self.run_phases = {}
+        self.gave_up = []
+        self.carried_forward = 0
+
+    def attempt(self, url, attempt):
+        return AttemptTimer(url, attempt)
+
+    def add(self, record):
+        self.records.append(record)
+
+    def merge(self, other):
+        """Fold in the metrics a shard worker process collected"""
+        self.records.extend(other.records)
+        self.gave_up.extend(other.gave_up)
+        for name, value in other.run_phases.items():
+            self.run_phases[name] = self.run_phases.get(name, 0.0) + value
+
+    @contextmanager
+    def run_phase(self, name):
+        """Time run-wide work, like the up-front login"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.run_phases[name] = (
+                self.run_phases.get(name, 0.0) + time.monotonic() - start
+            )
+
+    def summary(self):
+        totals = [record["total"] for record in self.records]
+        accounts = {record["url"] for record in self.records}
+        succeeded = {record["url"] for record in self.records if record["ok"]}
+        return {
+            "run": self.run_id,
+            "wall_time": round(time.monotonic() - self.start, 3),
+            "accounts": len(accounts),
+            "succeeded": len(succeeded),
+            "attempts": len(self.records),
+            "failed_attempts": sum(1 for record in self.records if not record["ok"]),
+            "retried_accounts": len(
+                {record["url"] for record in self.records if record["attempt"] > 1}
+            ),
+            "gave_up": len(self.gave_up),
+            "carried_forward": self.carried_forward,
+            "latency": latency_summary(totals),
+            "phases": {
+                name: latency_summary(
+                    [
+                        record["phases"][name]
+                        for record in self.records
+                        if name in record["phases"]
+                    ]
+                )
+                for name in PHASES
+            },
+            "run_phases": {
+                name: round(value, 3) for name, value in self.run_phases.items()
+            },
+            "slowest": sorted(
+                self.records, key=lambda record: record["total"], reverse=True
+            )[:5],
+        }
+
+    def write(self):
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with open(ACCOUNT_METRICS_PATH, "a") as file:
+            for record in self.records:
+                file.write(json.dumps({"run": self.run_id, **record}) + "\n")
+        summary = self.summary()
+        with open(RUN_METRICS_PATH, "a") as file:
+            file.write(json.dumps(summary) + "\n")
+        latency = summary["latency"]
+        print(
+            f"Scraped {summary['succeeded']}/{summary['accounts']} accounts in "
+            f"{summary['wall_time']:.1f}s (p50 {latency['p50']}s, p95 {latency['p95']}s, "
+            f"max {latency['max']}s), {summary['failed_attempts']} failed attempts"
+        )
+        return summary
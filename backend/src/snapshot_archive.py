@@ -0,0 +1,295 @@
+"""Daily zip bundles of old leaderboard snapshots
+
+main.py writes every scrape as a loose file in leaderboards/in_time or
+leaderboards/out_of_time. Once a day is over, `pixi run archive_snapshots`
+rolls its files into one leaderboards/archive/YYYY-MM-DD.zip, with members
+named in_time/leaderboard-....json or out_of_time/leaderboard-....json. One
+compressed file per day replaces a couple of hundred, and the zip's central
+directory is the index, so a single snapshot is read without inflating the
+rest of the day.
+
+Every snapshot main.py writes is also recorded as a row of
+leaderboards/manifest.csv:
+
+    time,path,in_time,players,sha256,bundle
+
+with `time` in ISO format (cheaper to parse than the file names) and `path` relative to leaderboards/ (in_time/leaderboard-....json, which is
+also its member name once archived). `bundle` is empty while the snapshot is
+a loose file; archiving appends the row again with the bundle it went into
+(archive/YYYY-MM-DD.zip) and the last row for a snapshot wins. Anything that
+reads old snapshots should go through list_snapshots / latest_snapshot /
+read_snapshot / load_snapshots, which find snapshots from the manifest alone
+instead of listing directories and zips, and see loose files and bundles
+alike.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import zipfile
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime
+from glob import glob
+
+from trading_calendar import NY, is_in_session
+
+LEADERBOARDS_DIR = "./backend/leaderboards"
+ARCHIVE_DIR = os.path.join(LEADERBOARDS_DIR, "archive")
+BUCKETS = ("in_time", "out_of_time")
+MANIFEST_FILE = "manifest.csv"
+FILE_NAME_FORMAT = "leaderboard-%Y-%m-%d-%H_%M.json"
+
+# bundle is the zip the snapshot is archived in, None for a loose file
+Snapshot = namedtuple("Snapshot", ["name", "bucket", "bundle"])
+# bundle is relative to the leaderboards directory, None for a loose file
+ManifestEntry = namedtuple(
+    "ManifestEntry", ["time", "path", "in_time", "players", "sha256", "bundle"]
+)
+
+
+def snapshot_time(name):
+    """The (New York wall clock) time a snapshot file name was written at"""
+    return datetime.strptime(name, FILE_NAME_FORMAT)
+
+
+def bucket_for(name):
+    return "in_time" if is_in_session(snapshot_time(name)) else "out_of_time"
+
+
+def scan_snapshots(buckets=BUCKETS, leaderboards_dir=LEADERBOARDS_DIR):
+    """Every snapshot in `buckets` found on disk, oldest first
+
+    Lists the bucket directories and every bundle, list_snapshots gets the
+    same from the manifest without opening anything.
+    """
+    snapshots = {}
+    for bundle in sorted(glob(os.path.join(leaderboards_dir, "archive", "*.zip"))):
+        with zipfile.ZipFile(bundle) as archive:
+            for member in archive.namelist():
+                bucket, name = member.split("/")
+                if bucket in buckets:
+                    snapshots[name] = Snapshot(name, bucket, bundle)
+    # A loose copy wins if archiving was interrupted before it was removed
+    for bucket in buckets:
+        for path in glob(os.path.join(leaderboards_dir, bucket, "*.json")):
+            name = os.path.basename(path)
+            snapshots[name] = Snapshot(name, bucket, None)
+    return [snapshots[name] for name in sorted(snapshots)]
+
+
+def _manifest_row(entry):
+    return [
+        entry.time.isoformat(timespec="minutes"),
+        entry.path,
+        int(entry.in_time),
+        entry.players,
+        entry.sha256,
+        entry.bundle or "",
+    ]
+
+
+def rebuild_manifest(leaderboards_dir=LEADERBOARDS_DIR):
+    """Write the manifest from scratch from the snapshots on disk"""
+    snapshots = scan_snapshots(leaderboards_dir=leaderboards_dir)
+    print(f"Indexing {len(snapshots)} snapshots into {MANIFEST_FILE}")
+    path = os.path.join(leaderboards_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w", newline="") as file:
+        writer = csv.writer(file)
+        for snapshot, content in _load_contents(snapshots, leaderboards_dir):
+            entry = ManifestEntry(
+                snapshot_time(snapshot.name),
+                f"{snapshot.bucket}/{snapshot.name}",
+                snapshot.bucket == "in_time",
+                len(json.loads(content)),
+                hashlib.sha256(content).hexdigest(),
+                snapshot.bundle and os.path.relpath(snapshot.bundle, leaderboards_dir),
+            )
+            writer.writerow(_manifest_row(entry))
+    os.replace(path + ".tmp", path)
+
+
+def record_snapshot(path, content, leaderboards_dir=LEADERBOARDS_DIR):
+    """Add the snapshot main.py just wrote at leaderboards_dir/`path` to the manifest
+
+    `content` is the bytes written. The manifest is built from what's on disk
+    first if there isn't one yet.
+    """
+    manifest = os.path.join(leaderboards_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest):
+        rebuild_manifest(leaderboards_dir)
+        return
+    bucket, name = path.split("/")
+    entry = ManifestEntry(
+        snapshot_time(name),
+        path,
+        bucket == "in_time",
+        len(json.loads(content)),
+        hashlib.sha256(content).hexdigest(),
+        None,
+    )
+    with open(manifest, "a", newline="") as file:
+        csv.writer(file).writerow(_manifest_row(entry))
+
+
+def read_manifest(leaderboards_dir=LEADERBOARDS_DIR):
+    """Every ManifestEntry, oldest first"""
+    path = os.path.join(leaderboards_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        rebuild_manifest(leaderboards_dir)
+    with open(path, "r", newline="") as file:
+        rows = list(csv.reader(file))
+    if any(len(row) < len(ManifestEntry._fields) for row in rows):
+        # Written before bundles were recorded
+        rebuild_manifest(leaderboards_dir)
+        return read_manifest(leaderboards_dir)
+    entries = {
+        row[1].split("/")[1]: ManifestEntry(
+            datetime.fromisoformat(row[0]),
+            row[1],
+            row[2] == "1",
+            int(row[3]),
+            row[4],
+            row[5] or None,
+        )
+        for row in rows
+    }
+    # Keyed by file name, a snapshot written twice in a minute keeps its last row
+    return [entries[name] for name in sorted(entries)]
+
+
+def list_snapshots(
+    buckets=BUCKETS, leaderboards_dir=LEADERBOARDS_DIR, start=None, end=None
+):
+    """Every snapshot in `buckets` taken in [start, end), oldest first
+
+    Either end left as None is unbounded.
+    """
+    entries = read_manifest(leaderboards_dir)
+    times = [entry.time for entry in entries]
+    first = 0 if start is None else bisect_left(times, start)
+    last = len(entries) if end is None else bisect_left(times, end)
+    snapshots = []
+    for entry in entries[first:last]:
+        bucket, name = entry.path.split("/")
+        if bucket not in buckets:
+            continue
+        bundle = entry.bundle and os.path.join(leaderboards_dir, entry.bundle)
+        snapshots.append(Snapshot(name, bucket, bundle))
+    return snapshots
+
+
+def latest_snapshot(buckets=BUCKETS, leaderboards_dir=LEADERBOARDS_DIR):
+    """The newest snapshot in `buckets`, None if there isn't one"""
+    snapshots = list_snapshots(buckets, leaderboards_dir)
+    return snapshots[-1] if snapshots else None
+
+
+def read_snapshot(snapshot, leaderboards_dir=LEADERBOARDS_DIR):
+    if snapshot.bundle is None:
+        with open(os.path.join(leaderboards_dir, snapshot.bucket, snapshot.name)) as f:
+            return json.load(f)
+    with zipfile.ZipFile(snapshot.bundle) as archive:
+        return json.loads(archive.read(f"{snapshot.bucket}/{snapshot.name}"))
+
+
+def _load_contents(snapshots, leaderboards_dir=LEADERBOARDS_DIR):
+    """Yield (snapshot, raw bytes) for each snapshot, opening each bundle only once"""
+    archive = None
+    try:
+        for snapshot in snapshots:
+            if snapshot.bundle is None:
+                path = os.path.join(leaderboards_dir, snapshot.bucket, snapshot.name)
+                with open(path, "rb") as file:
+                    yield snapshot, file.read()
+                continue
+            if archive is None or archive.filename != snapshot.bundle:
+                if archive is not None:
+                    archive.close()
+                archive = zipfile.ZipFile(snapshot.bundle)
+            yield snapshot, archive.read(f"{snapshot.bucket}/{snapshot.name}")
+    finally:
+        if archive is not None:
+            archive.close()
+
+
+def load_snapshots(snapshots, leaderboards_dir=LEADERBOARDS_DIR):
+    """Yield (snapshot, data) for each snapshot, opening each bundle only once"""
+    for snapshot, content in _load_contents(snapshots, leaderboards_dir):
+        yield snapshot, json.loads(content)
+
+
+def archive_closed_days(now=None, leaderboards_dir=LEADERBOARDS_DIR):
+    """Move the loose snapshots of every day before today into daily bundles"""
+    today = (now or datetime.now(NY)).date()
+    by_day = {}
+    for bucket in BUCKETS:
+        for path in glob(os.path.join(leaderboards_dir, bucket, "*.json")):
+            name = os.path.basename(path)
+            day = snapshot_time(name).date()
+            if day < today:
+                by_day.setdefault(day, []).append((bucket, name, path))
+
+    archive_dir = os.path.join(leaderboards_dir, "archive")
+    os.makedirs(archive_dir, exist_ok=True)
+    for day, files in sorted(by_day.items()):
+        bundle = os.path.join(archive_dir, f"{day.isoformat()}.zip")
+        with zipfile.ZipFile(
+            bundle, "a", compression=zipfile.ZIP_DEFLATED, compresslevel=9
+        ) as archive:
+            archived = set(archive.namelist())
+            for bucket, name, path in sorted(files):
+                if f"{bucket}/{name}" not in archived:
+                    archive.write(path, f"{bucket}/{name}")
+        # Only once the bundle is closed (and so complete) can the manifest
+        # point at it and the loose files be removed
+        _record_archived(files, bundle, leaderboards_dir)
+        for _bucket, _name, path in files:
+            os.remove(path)
+        print(f"Archived {len(files)} snapshots into {bundle}")
+
+
+def _record_archived(files, bundle, leaderboards_dir=LEADERBOARDS_DIR):
+    """Append the manifest rows of `files`, (bucket, name, path)s, now in `bundle`"""
+    manifest = os.path.join(leaderboards_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest):
+        return  # built from what's on disk when it's next read
+    entries = {
+        os.path.basename(entry.path): entry for entry in read_manifest(leaderboards_dir)
+    }
+    if any(name not in entries for _bucket, name, _path in files):
+        # Snapshots the manifest never heard of, start it over
+        os.remove(manifest)
+        return
+    relative = os.path.relpath(bundle, leaderboards_dir)
+    with open(manifest, "a", newline="") as file:
+        writer = csv.writer(file)
+        for _bucket, name, _path in sorted(files):
+            writer.writerow(_manifest_row(entries[name]._replace(bundle=relative)))
+
+
+def rebucket_bundle(bundle):
+    """Move a bundle's snapshots into the bucket the trading calendar says"""
+    with zipfile.ZipFile(bundle) as archive:
+        members = archive.namelist()
+        moves = {}
+        for member in members:
+            bucket, name = member.split("/")
+            if bucket_for(name) != bucket:
+                moves[member] = f"{bucket_for(name)}/{name}"
+        if not moves:
+            return
+        # Zips can't rename in place, write a corrected copy and swap it in
+        with zipfile.ZipFile(
+            bundle + ".tmp", "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9
+        ) as rewritten:
+            for member in members:
+                rewritten.writestr(moves.get(member, member), archive.read(member))
+    os.replace(bundle + ".tmp", bundle)
+    for old, new in moves.items():
+        print(f"Moved {old} to {new} in {bundle}")
+
+
+if __name__ == "__main__":
+    archive_closed_days()
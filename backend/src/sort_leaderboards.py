@@ -1,7 +1,10 @@
 import os
 import shutil
 from datetime import datetime
-import pytz
+from glob import glob
+
+from snapshot_archive import rebucket_bundle, rebuild_manifest
+from trading_calendar import is_in_session
 
 
 def get_time_from_filename(filename):
@@ -21,20 +24,9 @@ def sort_files_in_directory(directory, destination_in_time, destination_out_of_t
             full_path = os.path.join(directory, filename)
             file_time = get_time_from_filename(full_path)
             if file_time:
-                # Convert to New York timezone
-                tz_NY = pytz.timezone("America/New_York")
-                file_time = tz_NY.localize(file_time)
-
-                # Check if the file date is a weekday
-                if file_time.weekday() < 5:  # 0 = Monday, 4 = Friday
-                    if (
-                        file_time.hour > 9
-                        or (file_time.hour == 9 and file_time.minute >= 30)
-                    ) and file_time.hour < 16:
-                        destination = destination_in_time
-                    else:
-                        destination = destination_out_of_time
-                    print(file_time, file_time.weekday)
+                # File names are New York time, same calendar main.py writes with
+                if is_in_session(file_time):
+                    destination = destination_in_time
                 else:
                     destination = destination_out_of_time
 
@@ -49,3 +41,10 @@ out_of_time_dir = "./backend/leaderboards/out_of_time"
 
 # Sort files in the base directory, properly this time
 sort_files_in_directory("./backend/leaderboards/", in_time_dir, out_of_time_dir)
+
+# Archived days are sorted inside their bundles
+for bundle in sorted(glob("./backend/leaderboards/archive/*.zip")):
+    rebucket_bundle(bundle)
+
+# Snapshots may have changed buckets, which the manifest records
+rebuild_manifest()
@@ -0,0 +1,156 @@
+"""NYSE trading calendar shared by the scraper, the page generator and the bot
+
+Everything that needs to know "is the market open" or "does this snapshot
+count as in_time" should go through here so they all agree.
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+NY = ZoneInfo("America/New_York")
+
+
+def _parse_time(text):
+    hour, minute = text.split(":")
+    return time(int(hour), int(minute))
+
+
+# Regular session, the close on early close days, and how long after the close
+# snapshots still count as in_time (values keep settling for a while)
+SESSION_OPEN = _parse_time(os.environ.get("SESSION_OPEN", "09:30"))
+SESSION_CLOSE = _parse_time(os.environ.get("SESSION_CLOSE", "16:00"))
+EARLY_CLOSE = _parse_time(os.environ.get("SESSION_EARLY_CLOSE", "13:00"))
+SESSION_GRACE = timedelta(minutes=int(os.environ.get("SESSION_GRACE_MINUTES", "60")))
+
+
+def _nth_weekday(year, month, weekday, n):
+    """The nth (1-based, negative counts from the end) weekday of a month"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = (
+        date(year, month + 1, 1) - timedelta(days=1)
+        if month < 12
+        else date(year, 12, 31)
+    )
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    weekday_offset = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * weekday_offset) // 451
+    month, day = divmod(h + weekday_offset - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day):
+    """Saturday holidays move to Friday, Sunday holidays to Monday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year):
+    """Full day NYSE closures for a year, as {date: name}"""
+    holidays = {
+        _nth_weekday(year, 1, 0, 3): "Martin Luther King Jr. Day",
+        _nth_weekday(year, 2, 0, 3): "Presidents' Day",
+        _easter(year) - timedelta(days=2): "Good Friday",
+        _nth_weekday(year, 5, 0, -1): "Memorial Day",
+        _observed(date(year, 7, 4)): "Independence Day",
+        _nth_weekday(year, 9, 0, 1): "Labor Day",
+        _nth_weekday(year, 11, 3, 4): "Thanksgiving Day",
+        _observed(date(year, 12, 25)): "Christmas Day",
+    }
+    # NYSE doesn't close on Friday Dec 31 when New Year's falls on a Saturday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays[_observed(new_year)] = "New Year's Day"
+    if year >= 2022:
+        holidays[_observed(date(year, 6, 19))] = "Juneteenth"
+    return holidays
+
+
+@lru_cache(maxsize=None)
+def nyse_early_closes(year):
+    """Days the NYSE closes at EARLY_CLOSE, as {date: name}"""
+    candidates = {
+        date(year, 7, 3): "Independence Day Eve",
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1): "Day after Thanksgiving",
+        date(year, 12, 24): "Christmas Eve",
+    }
+    return {
+        day: name
+        for day, name in candidates.items()
+        if day.weekday() < 5 and day not in nyse_holidays(year)
+    }
+
+
+def is_trading_day(day):
+    if isinstance(day, datetime):
+        day = to_new_york(day).date()
+    return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+
+def session_hours(day):
+    """(open, close) wall clock times for a trading day, or None if closed"""
+    if not is_trading_day(day):
+        return None
+    close = EARLY_CLOSE if day in nyse_early_closes(day.year) else SESSION_CLOSE
+    return SESSION_OPEN, close
+
+
+def to_new_york(moment):
+    """Aware datetimes are converted, naive ones are taken to already be NY time"""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(NY).replace(tzinfo=None)
+
+
+def is_in_session(moment, before=timedelta(0), after=SESSION_GRACE):
+    """Whether `moment` falls in the trading session, widened by before/after
+
+    With the defaults this is the definition of an in_time snapshot: from the
+    open until SESSION_GRACE past the (possibly early) close.
+    """
+    moment = to_new_york(moment)
+    hours = session_hours(moment.date())
+    if hours is None:
+        return False
+    open_at = datetime.combine(moment.date(), hours[0]) - before
+    close_at = datetime.combine(moment.date(), hours[1]) + after
+    return open_at <= moment < close_at
+
+
+def trading_timestamps(start, end, interval=timedelta(minutes=5)):
+    """Every `interval` from the open through the close of each trading day
+
+    Days are included from start's date until the last one that opens by
+    `end`. Works on wall clock time: the result carries start's tzinfo, so
+    callers get timestamps in whatever timezone they passed in.
+    """
+    timestamps = []
+    day = start.date()
+    while datetime.combine(day, SESSION_OPEN, tzinfo=start.tzinfo) <= end:
+        hours = session_hours(day)
+        if hours is not None:
+            current = datetime.combine(day, hours[0], tzinfo=start.tzinfo)
+            close = datetime.combine(day, hours[1], tzinfo=start.tzinfo)
+            while current <= close:
+                timestamps.append(current)
+                current += interval
+        day += timedelta(days=1)
+    return timestamps
@@ -3,11 +3,23 @@ from discord.ext import commands, tasks
 from discord import app_commands
 import datetime
 import os
+import sys
 import json
 import pandas as pd
 from pytz import timezone
 from dotenv import load_dotenv
 
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", "..", "backend", "src"
+    )
+)
+from history_db import HistoryDB  # noqa: E402
+from history_store import TIME_FORMAT, shared_history  # noqa: E402
+from holding import format_amount, format_gain, parse_holdings  # noqa: E402
+from snapshot_archive import latest_snapshot, read_snapshot  # noqa: E402
+from trading_calendar import is_in_session  # noqa: E402
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -16,6 +28,10 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.guilds = True
 
+# Time of the last snapshot compare_stock_changes announced trades up to,
+# next to leaderboard-latest.json so the directory is always there
+LAST_CHECKED_PATH = "./backend/leaderboards/last-checked.txt"
+
 # Initialize bot instance with command prefix
 bot = commands.Bot(command_prefix="$", intents=intents)
 
@@ -33,23 +49,22 @@ def get_user_info(df, username):
     user_money = user_data["Money In Account"]
     user_stocks = user_data["Stocks Invested In"]
     formatted_holdings = "\n".join(
-        [f"{stock[0]}: {stock[1]} ({stock[2]})" for stock in user_stocks]
+        [
+            f"{holding.symbol}: {format_amount(holding.amount)} ({format_gain(holding.gain)})"
+            for holding in parse_holdings(user_stocks)
+        ]
     )
     return user_name, user_money, formatted_holdings
 
 
 def get_latest_in_time_leaderboard():
     """
-    Get the most recent leaderboard file from the in_time directory.
+    Get the most recent in_time leaderboard, looked up in the snapshot manifest.
     """
-    in_time_dir = "./backend/leaderboards/in_time"
-    files = [f for f in os.listdir(in_time_dir) if f.endswith(".json")]
-    if not files:
+    snapshot = latest_snapshot(("in_time",))
+    if snapshot is None:
         return None
-    latest_file = max(
-        files, key=lambda x: os.path.getctime(os.path.join(in_time_dir, x))
-    )
-    return os.path.join(in_time_dir, latest_file)
+    return read_snapshot(snapshot)
 
 
 def get_pst_time():
@@ -59,43 +74,32 @@ def get_pst_time():
 
 async def compare_stock_changes(channel):
     """
-    Compare current leaderboard with snapshot to detect stock changes, and send updates to the Discord channel as embeds.
+    Announce the trades made since the last check, read straight from the holdings deltas in the history store, as embeds.
     """
     try:
-        # Load the snapshot file
-        snapshot_path = "./backend/leaderboards/snapshots/leaderboard-snapshot.json"
-        if not os.path.exists(snapshot_path):
-            # If snapshot doesn't exist, create it and return
-            with open("./backend/leaderboards/leaderboard-latest.json", "r") as f:
-                current_data = json.load(f)
-            with open(snapshot_path, "w") as f:
-                json.dump(current_data, f)
+        history = shared_history()
+        if len(history) == 0:
+            return
+        latest_time = history.times[-1].strftime(TIME_FORMAT)
+        if not os.path.exists(LAST_CHECKED_PATH):
+            # First run, just remember where we are
+            with open(LAST_CHECKED_PATH, "w") as f:
+                f.write(latest_time)
             return
 
-        # Load both snapshot and current data
-        with open(snapshot_path, "r") as f:
-            previous_data = json.load(f)
-        with open("./backend/leaderboards/leaderboard-latest.json", "r") as f:
-            current_data = json.load(f)
-        # Compare holdings for each user
-        for username in current_data:
-            if username not in previous_data:
-                continue
-
-            # Get current and previous stock symbols
-            current_stocks = set(stock[0] for stock in current_data[username][2])
-            previous_stocks = set(stock[0] for stock in previous_data[username][2])
-
-            # Find new and removed stocks
-            new_stocks = current_stocks - previous_stocks
-            removed_stocks = previous_stocks - current_stocks
-
-            if new_stocks or removed_stocks:
+        with open(LAST_CHECKED_PATH, "r") as f:
+            last_checked = datetime.datetime.strptime(f.read().strip(), TIME_FORMAT)
+        last_row = history.row_at(last_checked)
+        if last_row is not None:
+            for username, symbols in history.trades_since(last_row).items():
                 description = ""
-                for stock in new_stocks:
-                    description += f"+ Bought {stock}\n"
-                for stock in removed_stocks:
-                    description += f"- Sold {stock}\n"
+                for stock, op in symbols.items():
+                    if op == "+":
+                        description += f"+ Bought {stock}\n"
+                    elif op == "-":
+                        description += f"- Sold {stock}\n"
+                    else:
+                        description += f"~ Changed position in {stock}\n"
 
                 embed = discord.Embed(
                     colour=discord.Colour.green(),
@@ -105,9 +109,9 @@ async def compare_stock_changes(channel):
                 )
                 await channel.send(embed=embed)
 
-        # Update the snapshot with current data after comparison
-        with open(snapshot_path, "w") as f:
-            json.dump(current_data, f)
+        # Remember the snapshot we got up to
+        with open(LAST_CHECKED_PATH, "w") as f:
+            f.write(latest_time)
 
     except Exception as e:
         await channel.send(f"Error comparing stock changes: {str(e)}")
@@ -241,59 +245,90 @@ async def leaderboard(interaction: discord.Interaction, count: int = 1):
         await interaction.followup.send(f"Error fetching leaderboard: {str(e)}")
 
 
+@bot.tree.command(name="holders", description="See who holds a stock")
+@app_commands.describe(ticker="Stock ticker, e.g. NVDA")
+async def holders(interaction: discord.Interaction, ticker: str):
+    """
+    Respond to the /holders command with the players holding a ticker, biggest position first.
+    """
+    await interaction.response.defer()
+    try:
+        db = HistoryDB()
+        db.sync()
+        ticker_holders = db.ticker_holders(ticker)
+        db.close()
+        if not ticker_holders:
+            await interaction.followup.send(f"Nobody holds {ticker.upper()} right now.")
+            return
+
+        description = ""
+        for user_name, amount, gain in ticker_holders[:20]:
+            if amount is None:
+                description += f"**{user_name}**\n"
+            else:
+                description += f"**{user_name}**: ${amount:,.2f} ({gain:.2f}%)\n"
+
+        embed = discord.Embed(
+            colour=discord.Colour.blue(),
+            title=f"{len(ticker_holders)} players hold {ticker.upper()}",
+            description=description,
+            timestamp=get_pst_time(),
+        )
+        await interaction.followup.send(embed=embed)
+    except Exception as e:
+        await interaction.followup.send(f"Error fetching holders: {str(e)}")
+
+
 @tasks.loop(minutes=1)
 async def send_leaderboard():
     """
     Periodically send the leaderboard update to the Discord channels during trading hours.
     """
     now = datetime.datetime.now(timezone("US/Eastern"))
-    if now.weekday() < 5:
-        start_time = now.replace(hour=9, minute=15, second=0, microsecond=0)
-        end_time = now.replace(hour=16, minute=15, second=0, microsecond=0)
-        if start_time <= now <= end_time:
-            try:
-                with open(
-                    "./backend/leaderboards/leaderboard-latest.json", "r"
-                ) as file:
-                    data = json.load(file)
-                df = pd.DataFrame.from_dict(data, orient="index")
-                df.reset_index(inplace=True)
-                df.columns = [
-                    "Account Name",
-                    "Money In Account",
-                    "Investopedia Link",
-                    "Stocks Invested In",
-                ]
-                df.sort_values(by="Money In Account", ascending=False, inplace=True)
-
-                top_ranked_name, top_ranked_money, top_ranked_stocks = get_user_info(
-                    df, df.iloc[0]["Account Name"]
-                )
-                leaderboard_channel_id = int(
-                    os.environ.get("DISCORD_CHANNEL_ID_Leaderboard")
+    if is_in_session(
+        now, before=datetime.timedelta(minutes=15), after=datetime.timedelta(minutes=15)
+    ):
+        try:
+            with open("./backend/leaderboards/leaderboard-latest.json", "r") as file:
+                data = json.load(file)
+            df = pd.DataFrame.from_dict(data, orient="index")
+            df.reset_index(inplace=True)
+            df.columns = [
+                "Account Name",
+                "Money In Account",
+                "Investopedia Link",
+                "Stocks Invested In",
+            ]
+            df.sort_values(by="Money In Account", ascending=False, inplace=True)
+
+            top_ranked_name, top_ranked_money, top_ranked_stocks = get_user_info(
+                df, df.iloc[0]["Account Name"]
+            )
+            leaderboard_channel_id = int(
+                os.environ.get("DISCORD_CHANNEL_ID_Leaderboard")
+            )
+            stocks_channel_id = int(os.environ.get("DISCORD_CHANNEL_ID_Stocks"))
+            leaderboard_channel = bot.get_channel(leaderboard_channel_id)
+            stocks_channel = bot.get_channel(stocks_channel_id)
+
+            if leaderboard_channel:
+                embed = discord.Embed(
+                    colour=discord.Colour.dark_red(),
+                    title="Leaderboard Update!",
+                    description=(
+                        f"**Top Ranked Person:** {top_ranked_name}\n\n"
+                        f"**Current Money:** {top_ranked_money}\n\n"
+                        f"**Current Holdings:**\n{top_ranked_stocks}"
+                    ),
+                    timestamp=get_pst_time(),
                 )
-                stocks_channel_id = int(os.environ.get("DISCORD_CHANNEL_ID_Stocks"))
-                leaderboard_channel = bot.get_channel(leaderboard_channel_id)
-                stocks_channel = bot.get_channel(stocks_channel_id)
-
-                if leaderboard_channel:
-                    embed = discord.Embed(
-                        colour=discord.Colour.dark_red(),
-                        title="Leaderboard Update!",
-                        description=(
-                            f"**Top Ranked Person:** {top_ranked_name}\n\n"
-                            f"**Current Money:** {top_ranked_money}\n\n"
-                            f"**Current Holdings:**\n{top_ranked_stocks}"
-                        ),
-                        timestamp=get_pst_time(),
-                    )
-                    await leaderboard_channel.send(embed=embed)
-
-                if stocks_channel:
-                    await compare_stock_changes(stocks_channel)
-
-            except Exception as e:
-                print(f"Error in send_leaderboard: {str(e)}")
+                await leaderboard_channel.send(embed=embed)
+
+            if stocks_channel:
+                await compare_stock_changes(stocks_channel)
+
+        except Exception as e:
+            print(f"Error in send_leaderboard: {str(e)}")
 
 
 @bot.event